@@ -2,12 +2,10 @@
 import streamlit as st
 import os
 import re
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
 import streamlit_authenticator as stauth
 from streamlit_authenticator.utilities.exceptions import LoginError
-from app_modules import app_config, ui_landing, chat_utils,tool_declaration, ui_components
+from app_modules import app_config, ui_landing, chat_utils,tool_declaration, ui_components, pdf_extraction, fast_path, provider_clients
 from models import google_gemini as gemini, openai_chatgpt as openai
 
 st.set_page_config(
@@ -79,21 +77,23 @@ if "active_profile" not in st.session_state or not st.session_state.active_profi
     st.stop()
 
 ACTIVE_PROFILE_KEY = st.session_state.active_profile
+CURRENT_USER = st.session_state.get("username")
 
 if st.session_state.get("current_loaded_profile_for_chats") != ACTIVE_PROFILE_KEY:
-    st.session_state.chats = chat_utils.load_chats(ACTIVE_PROFILE_KEY)
+    st.session_state.chats = chat_utils.load_chats(ACTIVE_PROFILE_KEY, user=CURRENT_USER)
     st.session_state.current_loaded_profile_for_chats = ACTIVE_PROFILE_KEY
     st.session_state.active_chat = None
     st.session_state.pdf_to_display_in_dialog = None
 
 CURRENT_PROFILE_CONFIG = app_config.PROFILE_CONFIGS[ACTIVE_PROFILE_KEY]
 PREDEFINED_CHATS_FOR_PROFILE = CURRENT_PROFILE_CONFIG["predefined_chats"]
+pdf_extraction.prefetch_documents(PREDEFINED_CHATS_FOR_PROFILE.values())
 
 if "pdf_to_display_in_dialog" not in st.session_state:
     st.session_state.pdf_to_display_in_dialog = None
 
 if "chats" not in st.session_state:
-    st.session_state.chats = chat_utils.load_chats(ACTIVE_PROFILE_KEY)
+    st.session_state.chats = chat_utils.load_chats(ACTIVE_PROFILE_KEY, user=CURRENT_USER)
 
 for title, pdf_path_config in PREDEFINED_CHATS_FOR_PROFILE.items():
     if not (pdf_path_config and os.path.exists(pdf_path_config) and pdf_path_config.lower().endswith(".pdf")):
@@ -102,21 +102,20 @@ for title, pdf_path_config in PREDEFINED_CHATS_FOR_PROFILE.items():
     if title not in st.session_state.chats:
         st.session_state.chats[title] = {
             "pdf_path": pdf_path_config, "messages": [],
-            "gemini_cache_name": None, "gemini_cache_model": None, "cache_creation_failed": False,
-            "openai_thread_id": None, "openai_file_id": None,
+            "gemini_cache_name": None, "gemini_cache_model": None,
+            "openai_thread_id": None, "openai_vector_store_id": None,
         }
-        chat_utils.save_chat(ACTIVE_PROFILE_KEY, title, st.session_state.chats[title])
+        chat_utils.save_chat(ACTIVE_PROFILE_KEY, title, st.session_state.chats[title], user=CURRENT_USER)
     else:
-        st.session_state.chats[title].setdefault("cache_creation_failed", False)
         st.session_state.chats[title].setdefault("openai_thread_id", None)
-        st.session_state.chats[title].setdefault("openai_file_id", None)
+        st.session_state.chats[title].setdefault("openai_vector_store_id", None)
         if st.session_state.chats[title].get("pdf_path") != pdf_path_config:
             st.session_state.chats[title] = {
                 "pdf_path": pdf_path_config, "messages": [],
-                "gemini_cache_name": None, "gemini_cache_model": None, "cache_creation_failed": False,
-                "openai_thread_id": None, "openai_file_id": None,
+                "gemini_cache_name": None, "gemini_cache_model": None,
+                "openai_thread_id": None, "openai_vector_store_id": None,
             }
-            chat_utils.save_chat(ACTIVE_PROFILE_KEY, title, st.session_state.chats[title])
+            chat_utils.clear_chat(ACTIVE_PROFILE_KEY, title, st.session_state.chats[title], user=CURRENT_USER)
 
 if not st.session_state.get("active_chat"):
     valid_predefined_titles = [t for t, p in PREDEFINED_CHATS_FOR_PROFILE.items() if p and os.path.exists(p) and t in st.session_state.chats]
@@ -141,14 +140,17 @@ else:
 
     current_chat_data = st.session_state.chats[chat_title]
     chat_pdf_path = current_chat_data["pdf_path"]
-    current_chat_messages = current_chat_data["messages"]
+    current_chat_messages = chat_utils.get_messages(ACTIVE_PROFILE_KEY, chat_title, current_chat_data, user=CURRENT_USER)
 
     displayed_model_name = st.session_state.get("selected_model_name", app_config.DEFAULT_MODEL_NAME)
     pdf_basename_for_display = os.path.basename(chat_pdf_path)
     st.markdown(f"### Chat: {chat_title}")
     st.caption(f"⚡ Model: {displayed_model_name} | 📄 Statement: {pdf_basename_for_display}")
 
-    ui_components.display_chat_history(current_chat_messages)
+    ui_components.display_chat_history(
+        ACTIVE_PROFILE_KEY, chat_title, current_chat_data, CURRENT_USER,
+        window_key=f"history_window_{ACTIVE_PROFILE_KEY}_{chat_title}",
+    )
 
     input_for_processing = None
     if st.session_state.get("process_button_question", False):
@@ -180,21 +182,47 @@ if st.session_state.get("processing", False):
         api_model_id = app_config.AVAILABLE_MODELS[selected_model_name]
         answer_text = "Error: Model not recognized."
         effective_system_instruction = app_config.UNIFIED_SYSTEM_INSTRUCTION
+        document_mode = CURRENT_PROFILE_CONFIG.get("document_mode", app_config.DEFAULT_DOCUMENT_MODE)
+        fast_path_answer = None
+        if app_config.STATEMENT_FAST_PATH_ENABLED:
+            fast_path_answer = fast_path.answer_question(chat_pdf_path, user_query)
+
+        if fast_path_answer is not None:
+            answer_text = fast_path_answer
+            if "OpenAI" in selected_model_name:
+                # The assistant only sees its thread, so the canned turn is posted there for later follow-ups.
+                st.session_state.chats[chat_title]["openai_thread_id"] = openai.record_turn(
+                    OPENAI_API_KEY, current_chat_data.get("openai_thread_id"), user_query, answer_text
+                )
+
+        elif "Google" in selected_model_name:
+            # Gemini is sent the whole conversation, including messages older than the loaded history window.
+            chat_utils.load_earlier_messages(ACTIVE_PROFILE_KEY, chat_title, current_chat_data, user=CURRENT_USER, limit=None)
+            client = provider_clients.get_gemini_client(GOOGLE_API_KEY)
+            gemini.start_cache_reaper(GOOGLE_API_KEY)
+            gemini_tool_config = tool_declaration.GEMINI_TOOL_CONFIG
+            stream_placeholder = None
+            if app_config.GEMINI_STREAMING_ENABLED:
+                with st.chat_message("assistant"):
+                    stream_placeholder = st.empty()
 
-        if "Google" in selected_model_name:
-            client = genai.Client(api_key=GOOGLE_API_KEY)
-            gemini_tool_config = types.Tool(function_declarations=tool_declaration.ALL_GEMINI_TOOLS)
-            
             answer_text, updated_chat_data = gemini.generate_gemini_response(
                 client=client,
                 current_chat_messages=list(current_chat_messages), user_query=user_query,
                 current_chat_data=dict(current_chat_data), chat_pdf_path=chat_pdf_path,
                 system_instruction_str=effective_system_instruction, 
-                gemini_tool_config=gemini_tool_config
+                gemini_tool_config=gemini_tool_config,
+                document_mode=document_mode,
+                on_text=stream_placeholder.markdown if stream_placeholder else None
             )
             st.session_state.chats[chat_title].update(updated_chat_data)
 
         elif "OpenAI" in selected_model_name:
+            stream_placeholder = None
+            if app_config.OPENAI_STREAMING_ENABLED:
+                with st.chat_message("assistant"):
+                    stream_placeholder = st.empty()
+
             openai_result = openai.get_openai_response(
                 api_key=OPENAI_API_KEY,
                 model_id=api_model_id,
@@ -202,38 +230,28 @@ if st.session_state.get("processing", False):
                 pdf_path=chat_pdf_path,
                 user_query=user_query,
                 thread_id=current_chat_data.get("openai_thread_id"),
-                file_id=current_chat_data.get("openai_file_id")
+                vector_store_id=current_chat_data.get("openai_vector_store_id"),
+                document_mode=document_mode,
+                on_text=(lambda text: stream_placeholder.markdown(re.sub(r'【\d+:\d+†.*?】', '', text))) if stream_placeholder else None
             )
             raw_answer_text = openai_result["response_text"]
             cleaned_answer_text = re.sub(r'【\d+:\d+†.*?】', '', raw_answer_text).strip()
             answer_text = cleaned_answer_text
             st.session_state.chats[chat_title]["openai_thread_id"] = openai_result["thread_id"]
-            st.session_state.chats[chat_title]["openai_file_id"] = openai_result["file_id"]
+            st.session_state.chats[chat_title]["openai_vector_store_id"] = openai_result["vector_store_id"]
 
         current_chat_messages.append({"role": "assistant", "content": answer_text})
+        # Charts requested by tool calls join the same turn, saving a rerun and a save for charted answers.
+        for chart_spec in st.session_state.pop("chart_specs_to_display", []):
+            current_chat_messages.append({"role": "assistant", "type": "chart", "content": chart_spec})
         st.session_state.chats[chat_title]["messages"] = current_chat_messages
         
-        chat_utils.save_chat(ACTIVE_PROFILE_KEY, chat_title, st.session_state.chats[chat_title])
+        chat_utils.save_chat(ACTIVE_PROFILE_KEY, chat_title, st.session_state.chats[chat_title], user=CURRENT_USER)
         
         del st.session_state.query_to_process
         st.session_state.processing = False
         st.rerun()
 
-if "figure_to_display" in st.session_state and st.session_state.figure_to_display is not None:
-    fig = st.session_state.figure_to_display
-    
-    chat_title = st.session_state.active_chat
-    current_chat_messages = st.session_state.chats[chat_title].get("messages", [])
-    current_chat_messages.append({
-        "role": "assistant",
-        "type": "chart",
-        "content": fig.to_json() 
-    })
-    
-    chat_utils.save_chat(ACTIVE_PROFILE_KEY, chat_title, st.session_state.chats[chat_title])
-    
-    del st.session_state.figure_to_display
-    st.rerun()
 
 footer_html = """
 <style>
@@ -1,6 +1,79 @@
 import datetime
 
 BASE_CHAT_DIR = "chats"
+CHAT_STORE_BACKEND = "sqlite"  # "sqlite" (one WAL database, messages paged in on demand) or "files" (per-chat logs under BASE_CHAT_DIR)
+CHAT_STORE_DB_PATH = "chats/chats.sqlite"
+CHAT_LOG_FSYNC_POLICY = "always"  # "interval" fsyncs appended turns at most every CHAT_LOG_FSYNC_INTERVAL_SECONDS
+CHAT_LOG_FSYNC_INTERVAL_SECONDS = 5
+CHAT_LOG_COMPACT_THRESHOLD = 50  # Log records before the chat is rewritten into its snapshot in the background
+
+# --- Local Market Data Store ---
+PRICE_STORE_DIR = "price_store"
+PRICE_STORE_INTRADAY_TTL_SECONDS = 300
+PRICE_STORE_SETTLEMENT_SECONDS = 3600  # A day's close is stored as final only if fetched this long after the session ended
+PRICE_STORE_SPLIT_CHECK_SECONDS = 24 * 3600  # Split checks run in the background, never on the request path
+PRICE_STORE_SPLIT_RETRY_SECONDS = 15 * 60  # Backoff after a failed split check
+PRICE_STORE_SPLIT_LOOKBACK_DAYS = 7  # Overlap with the previous check, for splits the provider reported late
+SYMBOL_MASTER_PATH = "data/symbol_master.csv"
+SYMBOL_MATCH_THRESHOLD = 0.6
+SYMBOL_MATCH_MARGIN = 0.1
+PRICE_RANGE_DEFAULT_MAX_POINTS = 260
+
+# --- Market Data Provider ("yfinance" or "fixture"; overridable via MARKET_DATA_PROVIDER) ---
+MARKET_DATA_PROVIDER = "yfinance"
+MARKET_DATA_FIXTURE_DIR = "fixtures/market_data"
+MARKET_DATA_REQUEST_TIMEOUT_SECONDS = 10  # Per HTTP request, well inside TOOL_CALL_TIMEOUT_SECONDS
+
+# --- Local Document Extraction ---
+PDF_EXTRACTION_CACHE_DIR = "pdf_cache"
+STATEMENT_FAST_PATH_ENABLED = True
+
+# --- Document Context Modes ("full" attaches the PDF, "retrieval" sends only the top-ranked pages' text) ---
+DOCUMENT_MODE_FULL = "full"
+DOCUMENT_MODE_RETRIEVAL = "retrieval"
+DEFAULT_DOCUMENT_MODE = DOCUMENT_MODE_FULL
+RETRIEVAL_TOP_K_PAGES = 6
+
+# --- Remote File Uploads (shared per provider and PDF content hash) ---
+GEMINI_FILE_TTL_SECONDS = 47 * 3600  # Gemini deletes uploaded files after 48 hours
+OPENAI_FILE_TTL_SECONDS = 24 * 3600  # Revalidated, not re-uploaded, once this lapses
+UPLOAD_EXPIRY_MARGIN_SECONDS = 600
+UPLOAD_PROCESSING_TIMEOUT_SECONDS = 60
+UPLOAD_POLL_INTERVAL_SECONDS = 0.5
+
+# --- OpenAI Resource Registry (assistant IDs by fingerprint, vector stores by PDF content hash) ---
+OPENAI_REGISTRY_PATH = "openai_state/registry.json"
+OPENAI_VECTOR_STORE_IDLE_DAYS = 7  # OpenAI expires the store after this long without use
+OPENAI_VECTOR_STORE_REVALIDATE_SECONDS = 3600
+
+# --- Gemini Context Cache Pool (shared per PDF, model, system instruction and tool schema) ---
+GEMINI_CACHE_TTL_SECONDS = 3600
+GEMINI_CACHE_FAILURE_BACKOFF_SECONDS = 600  # Documents below the minimum cacheable size fail on every attempt
+GEMINI_CACHE_EXPIRY_MARGIN_SECONDS = 60
+GEMINI_CACHE_EXTEND_WITHIN_SECONDS = 900  # A cache used this close to expiry gets its TTL reset instead of being rebuilt
+GEMINI_CACHE_IDLE_SECONDS = 1800  # The reaper deletes a cache no saved chat names once no worker has created or extended it for this long
+GEMINI_CACHE_REAPER_INTERVAL_SECONDS = 300
+
+# --- Chat History Rendering ---
+CHART_FIGURE_CACHE_SIZE = 128
+CHAT_HISTORY_WINDOW = 20  # Most recent messages rendered; "Load earlier messages" reveals this many more each click
+
+# --- Response Streaming ---
+GEMINI_STREAMING_ENABLED = True
+OPENAI_STREAMING_ENABLED = True
+
+# --- Tool Execution (all calls of one model turn run concurrently) ---
+TOOL_EXECUTOR_MAX_WORKERS = 8
+TOOL_CALL_TIMEOUT_SECONDS = 30  # Per tool call, counted from when a worker starts it
+
+# --- Provider Clients (one long-lived client per provider and API key) ---
+PROVIDER_HTTP_MAX_CONNECTIONS = 20
+PROVIDER_HTTP_MAX_KEEPALIVE = 10
+PROVIDER_HTTP_CONNECT_TIMEOUT_SECONDS = 10
+PROVIDER_HTTP_READ_TIMEOUT_SECONDS = 300
+PROVIDER_MAX_RETRIES = 2
+PROVIDER_CLIENT_MAX_AGE_SECONDS = 6 * 3600
+PROVIDER_CLIENT_FAILURE_THRESHOLD = 3
 
 # --- Model Definitions ---
 AVAILABLE_MODELS = {
@@ -39,6 +112,11 @@ UNIFIED_SYSTEM_INSTRUCTION = (
     "12. When providing an answer using information from the document, you MUST cite the relevant page number at the end of the sentence. For example: 'The total tax paid was ₹15,000 (Page: 4)'. For multiple pages, use the format `(Pages: 4, 7)`."
     "13. If the user asks for a chart, graph, comparison, or any form of visual representation of data, you MUST use the `display_comparison_chart` tool. Extract the relevant labels and values from the document to pass as arguments to the tool."
     "14. When a user asks for a line graph of stock prices over a period, FIRST use the `get_historical_price_range` tool to fetch all the daily closing prices at once. THEN, pass the resulting data to the `display_comparison_chart` tool with `chart_type` set to 'line', `x_axis` set to 'Date', and `y_axis` set to 'Close'."
+    "\n15. When you need prices or index values for more than one symbol, or for one symbol on several dates, make a single call to the `get_historical_prices_batch` tool with all the symbols and dates instead of calling `get_historical_stock_price` repeatedly."
+    "\n16. The price tools automatically move a weekend date, and for NSE/BSE symbols an exchange-holiday date, to the previous trading session and report the date they actually used in the `date` field. Do not retry with guessed dates; tell the user which trading date the value is from when it differs from the date they asked for. Holidays of other exchanges are not known to the tools, so such a date can return no trading data; in that case tell the user the market was likely closed that day."
+    "\n17. When the document names a company (e.g., 'RELIANCE INDUSTRIES LTD') or gives an ISIN instead of a ticker, use the `resolve_ticker_symbol` tool to find the ticker rather than guessing it. The price tools also accept company names and ISINs directly. If a bare ticker is reported as quoted on more than one exchange, call again with the exact ticker (e.g. 'ITC.NS' for the NSE listing)."
+    "\n18. `get_historical_price_range` returns at most a few hundred points. For long ranges it answers with a `resolution` (e.g. 'weekly') and the points under `data`; pass `data` to the chart tool and mention the resolution to the user. Use `resample` or `max_points` when you need a specific granularity."
+    "\n19. For questions about how a stock or index performed over a period (return, CAGR, volatility, drawdown, or versus NIFTY/SENSEX), use the `get_price_performance` tool instead of fetching the price series and calculating it yourself."
 )
 
 # --- Profile Configurations ---
@@ -140,6 +218,7 @@ PROFILE_CONFIGS = {
     "profile4": {
         "button_label": "Demo 4 CDSL",
         "page_title": "CAS Statement Q&A",
+        "document_mode": DOCUMENT_MODE_RETRIEVAL,
         "predefined_chats": {
             "CAS April 2025 1": "documents/demo4/doc1.pdf",
             "CAS April 2025 2": "documents/demo4/doc2.pdf",
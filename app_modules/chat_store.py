@@ -0,0 +1,175 @@
+# app_modules/chat_store.py
+import os
+import json
+import time
+import sqlite3
+from .app_config import CHAT_STORE_DB_PATH
+
+
+def _connect():
+    db_dir = os.path.dirname(CHAT_STORE_DB_PATH)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(CHAT_STORE_DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # header holds every chat field except the messages (pdf_path, cache names, thread IDs, ...).
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS chats ("
+        "user TEXT NOT NULL, profile TEXT NOT NULL, title TEXT NOT NULL, header TEXT NOT NULL, "
+        "message_count INTEGER NOT NULL DEFAULT 0, updated_at REAL, PRIMARY KEY (user, profile, title))"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "user TEXT NOT NULL, profile TEXT NOT NULL, title TEXT NOT NULL, seq INTEGER NOT NULL, message TEXT NOT NULL, "
+        "PRIMARY KEY (user, profile, title, seq))"
+    )
+    # (user, profile) pairs whose chats from the files backend have been imported.
+    conn.execute("CREATE TABLE IF NOT EXISTS imports (user TEXT NOT NULL, profile TEXT NOT NULL, PRIMARY KEY (user, profile))")
+    return conn
+
+
+def list_chats(user, profile):
+    """Headers of every chat of user in profile, without their messages."""
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT title, header FROM chats WHERE user = ? AND profile = ?", (user, profile)).fetchall()
+    finally:
+        conn.close()
+    return {title: json.loads(header) for title, header in rows}
+
+
+def referenced_values(field):
+    """Distinct non-empty values of one header field across every stored chat."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT DISTINCT json_extract(header, ?) FROM chats", (f"$.{field}",)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {value for (value,) in rows if value}
+
+
+def load_page(user, profile, title, limit=None, before_seq=None):
+    """
+    The newest limit messages of one chat before before_seq (all of them without limit), in order, as
+    (sequence number of the first message returned, messages). The sequence number is also the count of messages
+    stored before the page, so 0 means the page reaches the start of the chat.
+    """
+    query = "SELECT seq, message FROM messages WHERE user = ? AND profile = ? AND title = ?"
+    params = [user, profile, title]
+    if before_seq is not None:
+        query += " AND seq < ?"
+        params.append(before_seq)
+    query += " ORDER BY seq DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    conn = _connect()
+    try:
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return 0, []
+    return rows[-1][0], [json.loads(message) for _, message in reversed(rows)]
+
+
+def save_chat(user, profile, title, header_changes, new_messages):
+    """
+    Merge header_changes into the stored chat header and append new_messages after the messages already stored.
+    Both happen inside one write transaction, so turns and header fields saved concurrently by several worker
+    processes never collide or revert each other. Returns the merged header.
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        stored_count, header = _read_header(conn, user, profile, title)
+        conn.executemany(
+            "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+            [(user, profile, title, stored_count + offset, json.dumps(message)) for offset, message in enumerate(new_messages)],
+        )
+        header.update(header_changes)
+        _upsert_header(conn, user, profile, title, header, stored_count + len(new_messages))
+        conn.commit()
+        return header
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def clear_chat(user, profile, title, header_changes):
+    """Delete the chat's messages and merge header_changes into its header; returns the merged header."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM messages WHERE user = ? AND profile = ? AND title = ?", (user, profile, title))
+        _, header = _read_header(conn, user, profile, title)
+        header.update(header_changes)
+        _upsert_header(conn, user, profile, title, header, 0)
+        conn.commit()
+        return header
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def is_imported(user, profile):
+    conn = _connect()
+    try:
+        return conn.execute("SELECT 1 FROM imports WHERE user = ? AND profile = ?", (user, profile)).fetchone() is not None
+    finally:
+        conn.close()
+
+
+def import_chats(user, profile, chats):
+    """
+    One-time import of chats ({title: (header, messages)}) kept by the files backend. Chats the database already
+    holds messages for are left alone. Returns False if this (user, profile) was imported before.
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT 1 FROM imports WHERE user = ? AND profile = ?", (user, profile)).fetchone():
+            conn.rollback()
+            return False
+        for title, (header, messages) in chats.items():
+            row = conn.execute(
+                "SELECT message_count FROM chats WHERE user = ? AND profile = ? AND title = ?", (user, profile, title)
+            ).fetchone()
+            if row and row[0]:
+                continue
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)",
+                [(user, profile, title, seq, json.dumps(message)) for seq, message in enumerate(messages)],
+            )
+            _upsert_header(conn, user, profile, title, header, len(messages))
+        conn.execute("INSERT INTO imports VALUES (?, ?)", (user, profile))
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _read_header(conn, user, profile, title):
+    row = conn.execute(
+        "SELECT message_count, header FROM chats WHERE user = ? AND profile = ? AND title = ?", (user, profile, title)
+    ).fetchone()
+    return (row[0], json.loads(row[1])) if row else (0, {})
+
+
+def _upsert_header(conn, user, profile, title, header, message_count):
+    conn.execute(
+        "INSERT INTO chats VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (user, profile, title) DO UPDATE SET "
+        "header = excluded.header, message_count = excluded.message_count, updated_at = excluded.updated_at",
+        (user, profile, title, json.dumps(header), message_count, time.time()),
+    )
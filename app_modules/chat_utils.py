@@ -1,41 +1,426 @@
 # app_modules/chat_utils.py
 import os
+import copy
 import json
-from .app_config import BASE_CHAT_DIR
+import time
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from . import chat_store
+from .app_config import (
+    BASE_CHAT_DIR, CHAT_STORE_BACKEND, CHAT_LOG_FSYNC_POLICY, CHAT_LOG_FSYNC_INTERVAL_SECONDS, CHAT_LOG_COMPACT_THRESHOLD,
+    CHAT_HISTORY_WINDOW,
+)
 
-def get_profile_chat_dir(profile_key):
+try:
+    import fcntl
+except ImportError:  # Windows: only threads within one process are serialized
+    fcntl = None
+
+# With the "files" backend each chat is stored as three files: a small header with everything except the messages,
+# a snapshot holding the messages up to the last compaction, and an append-only JSONL log of the messages added since.
+# Every read-modify-write holds an advisory lock on a fourth, empty ".lock" file, so several worker processes can
+# share BASE_CHAT_DIR.
+HEADER_SUFFIX = ".header.json"
+SNAPSHOT_SUFFIX = ".snapshot.json"
+LOG_SUFFIX = ".log.jsonl"
+LOCK_SUFFIX = ".lock"
+
+# Number of this session's messages already persisted; kept in chat_data but never written to the header.
+SYNCED_KEY = "_synced_messages"
+# With the sqlite backend, the store sequence number of chat_data["messages"][0]: how many older messages are not loaded.
+FIRST_SEQ_KEY = "_first_seq"
+# The header as this session last read or wrote it. save_chat sends only the fields that differ from it and merges
+# them into the stored header, so fields set meanwhile by other sessions (thread IDs, cache names, ...) are kept.
+SAVED_HEADER_KEY = "_saved_header"
+
+_chat_state = {}
+_chat_locks = {}
+_locks_guard = threading.Lock()
+_compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-compaction")
+
+def get_profile_chat_dir(profile_key, user=None):
     safe_profile_key = "".join(c if c.isalnum() else "_" for c in profile_key)
+    if user:
+        safe_user = "".join(c if c.isalnum() else "_" for c in user)
+        return os.path.join(BASE_CHAT_DIR, safe_user, safe_profile_key)
     return os.path.join(BASE_CHAT_DIR, safe_profile_key)
 
-def load_chats(profile_key):
-    profile_chat_dir = get_profile_chat_dir(profile_key)
-    os.makedirs(profile_chat_dir, exist_ok=True)
-    chats = {}
-    if os.path.exists(profile_chat_dir) and os.path.isdir(profile_chat_dir):
-        for file_name in os.listdir(profile_chat_dir):
-            if file_name.endswith(".json"):
-                file_path = os.path.join(profile_chat_dir, file_name)
+def _chat_base_path(profile_key, title, user=None):
+    safe_title = "".join(c if c.isalnum() or c in [' ', '-'] else "_" for c in title)
+    return os.path.join(get_profile_chat_dir(profile_key, user), safe_title)
+
+@contextmanager
+def _locked(base_path):
+    with _locks_guard:
+        thread_lock = _chat_locks.setdefault(base_path, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(base_path + LOCK_SUFFIX, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _apply_defaults(data):
+    data.setdefault("gemini_cache_name", None)
+    data.setdefault("gemini_cache_model", None)
+    data.setdefault("openai_thread_id", None)
+    data.setdefault("openai_vector_store_id", None)
+    return data
+
+def _header_of(chat_data):
+    return {key: value for key, value in chat_data.items() if key != "messages" and not key.startswith("_")}
+
+def _header_changes(chat_data):
+    header = _header_of(chat_data)
+    saved = chat_data.get(SAVED_HEADER_KEY)
+    if saved is None:
+        return header
+    return {key: value for key, value in header.items() if key not in saved or saved[key] != value}
+
+def _adopt_header(chat_data, header):
+    """Take the merged stored header into chat_data and remember it as the header this session last saw."""
+    chat_data.update(header)
+    chat_data[SAVED_HEADER_KEY] = copy.deepcopy(header)
+    return chat_data
+
+def _read_header(base_path):
+    if not os.path.exists(base_path + HEADER_SUFFIX):
+        return {}
+    with open(base_path + HEADER_SUFFIX, "r") as f:
+        header = json.load(f)
+    header.pop("title", None)
+    return header
+
+def _write_json_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _disk_version(base_path):
+    """Cheap fingerprint of the snapshot and log; it changes whenever any process appends, compacts or resets."""
+    version = []
+    for suffix in (SNAPSHOT_SUFFIX, LOG_SUFFIX):
+        try:
+            stat = os.stat(base_path + suffix)
+            version.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+def _read_messages(base_path):
+    """Snapshot messages plus the log records that continue them, skipping records left over from before a compaction or reset."""
+    snapshot = {"epoch": 0, "messages": []}
+    if os.path.exists(base_path + SNAPSHOT_SUFFIX):
+        with open(base_path + SNAPSHOT_SUFFIX, "r") as f:
+            snapshot = json.load(f)
+    messages = list(snapshot["messages"])
+    log_records = 0
+    if os.path.exists(base_path + LOG_SUFFIX):
+        with open(base_path + LOG_SUFFIX, "r") as f:
+            for line in f:
                 try:
-                    with open(file_path, "r") as f:
-                        data = json.load(f)
-                        if isinstance(data, dict) and "pdf_path" in data and "messages" in data:
-                            data.setdefault("gemini_cache_name", None)
-                            data.setdefault("gemini_cache_model", None)
-                            data.setdefault("cache_creation_failed", False)
-                            data.setdefault("openai_thread_id", None)
-                            data.setdefault("openai_file_id", None)
-                            chats[os.path.splitext(file_name)[0]] = data
-                except Exception as e:
-                    print(f"Warning: Error loading chat file {file_path}: {e}")
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Torn final line from an interrupted append
+                log_records += 1
+                if record["epoch"] == snapshot["epoch"] and record["seq"] == len(messages):
+                    messages.append(record["message"])
+    return snapshot["epoch"], messages, log_records
+
+def _current_state(base_path):
+    """This process's view of the chat on disk, re-read only if another process changed the files since (caller holds the lock)."""
+    state = _chat_state.get(base_path)
+    if state is None or state["version"] != _disk_version(base_path):
+        epoch, messages, log_records = _read_messages(base_path)
+        state = {
+            "epoch": epoch, "count": len(messages),
+            "log_records": log_records, "last_fsync": state["last_fsync"] if state else 0,
+            "version": _disk_version(base_path),
+        }
+        _chat_state[base_path] = state
+    return state
+
+def _write_snapshot(base_path, epoch, messages):
+    _write_json_atomic(base_path + SNAPSHOT_SUFFIX, {"epoch": epoch, "messages": messages})
+    with open(base_path + LOG_SUFFIX, "w"):
+        pass
+
+def _compact(base_path):
+    try:
+        with _locked(base_path):
+            state = _current_state(base_path)
+            if state["log_records"] < CHAT_LOG_COMPACT_THRESHOLD:
+                return
+            epoch, messages, _ = _read_messages(base_path)
+            _write_snapshot(base_path, epoch, messages)
+            state["log_records"] = 0
+            state["version"] = _disk_version(base_path)
+    except Exception as e:
+        print(f"Warning: Could not compact chat log {base_path}{LOG_SUFFIX}: {e}")
+
+def _migrate_legacy_chat(profile_chat_dir, file_name):
+    # Chats saved before the log format: one JSON file holding header fields and messages together.
+    file_path = os.path.join(profile_chat_dir, file_name)
+    title = os.path.splitext(file_name)[0]
+    base_path = os.path.join(profile_chat_dir, title)
+    with _locked(base_path):
+        if not os.path.exists(file_path):
+            return
+        with open(file_path, "r") as f:
+            data = json.load(f)
+        if not (isinstance(data, dict) and "pdf_path" in data and "messages" in data):
+            return
+        _write_snapshot(base_path, 0, data.pop("messages"))
+        _write_json_atomic(base_path + HEADER_SUFFIX, dict(data, title=title))
+        os.remove(file_path)
+
+def _read_file_chats(profile_chat_dir):
+    """Every chat the files backend keeps in profile_chat_dir, migrating legacy single-file chats first."""
+    chats = {}
+    if not os.path.isdir(profile_chat_dir):
+        return chats
+    for file_name in os.listdir(profile_chat_dir):
+        if file_name.endswith(".json") and not file_name.endswith((HEADER_SUFFIX, SNAPSHOT_SUFFIX)):
+            try:
+                _migrate_legacy_chat(profile_chat_dir, file_name)
+            except Exception as e:
+                print(f"Warning: Error migrating chat file {os.path.join(profile_chat_dir, file_name)}: {e}")
+
+    for file_name in os.listdir(profile_chat_dir):
+        if not file_name.endswith(HEADER_SUFFIX):
+            continue
+        base_path = os.path.join(profile_chat_dir, file_name[:-len(HEADER_SUFFIX)])
+        try:
+            with _locked(base_path):
+                with open(base_path + HEADER_SUFFIX, "r") as f:
+                    header = json.load(f)
+                epoch, messages, log_records = _read_messages(base_path)
+                _chat_state[base_path] = {
+                    "epoch": epoch, "count": len(messages), "log_records": log_records, "last_fsync": 0, "version": _disk_version(base_path),
+                }
+            chats[header.pop("title", os.path.basename(base_path))] = (header, messages)
+        except Exception as e:
+            print(f"Warning: Error loading chat file {base_path + HEADER_SUFFIX}: {e}")
     return chats
 
-def save_chat(profile_key, title, chat_data):
-    profile_chat_dir = get_profile_chat_dir(profile_key)
+def _copy_shared_chats(profile_key, user):
+    """
+    Chats saved before they were kept per user live in the shared BASE_CHAT_DIR/<profile> directory, where every
+    user saw them. The first time a user opens the profile, those chats are copied into the user's own directory.
+    """
+    user_dir = get_profile_chat_dir(profile_key, user)
+    shared_dir = get_profile_chat_dir(profile_key)
+    if not user or os.path.exists(user_dir) or not os.path.isdir(shared_dir):
+        return
+    _read_file_chats(shared_dir)  # Migrates legacy single-file chats in place
+    os.makedirs(os.path.dirname(user_dir), exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=os.path.dirname(user_dir), prefix=".import-")
+    try:
+        for file_name in os.listdir(shared_dir):
+            if not file_name.endswith(HEADER_SUFFIX):
+                continue
+            base_name = file_name[:-len(HEADER_SUFFIX)]
+            with _locked(os.path.join(shared_dir, base_name)):
+                for suffix in (HEADER_SUFFIX, SNAPSHOT_SUFFIX, LOG_SUFFIX):
+                    if os.path.exists(os.path.join(shared_dir, base_name + suffix)):
+                        shutil.copy2(os.path.join(shared_dir, base_name + suffix), os.path.join(temp_dir, base_name + suffix))
+        os.rename(temp_dir, user_dir)  # Fails if another worker copied them first
+    except OSError as e:
+        if not os.path.exists(user_dir):
+            print(f"Warning: Could not copy shared chats of profile {profile_key} for user {user}: {e}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def _import_file_chats(profile_key, user):
+    """Bring chats written by the files backend (the user's own, or else the shared pre-user ones) into the database once."""
+    source_dir = get_profile_chat_dir(profile_key, user)
+    if not os.path.isdir(source_dir):
+        source_dir = get_profile_chat_dir(profile_key)
+    try:
+        if chat_store.is_imported(user or "", profile_key):
+            return
+        chats = _read_file_chats(source_dir)
+        if chat_store.import_chats(user or "", profile_key, chats) and chats:
+            print(f"Imported {len(chats)} chat(s) of profile {profile_key} from {source_dir} into the chat database.")
+    except Exception as e:
+        print(f"Warning: Error importing chats from {source_dir}: {e}")
+
+def load_chats(profile_key, user=None):
+    """
+    Chats of user in profile_key. The sqlite backend returns headers only, with messages set to None until
+    get_messages is called for that chat; the files backend returns the messages as well.
+    """
+    if CHAT_STORE_BACKEND == "sqlite":
+        _import_file_chats(profile_key, user)
+        chats = {}
+        try:
+            for title, header in chat_store.list_chats(user or "", profile_key).items():
+                chats[title] = _adopt_header({"messages": None}, _apply_defaults(header))
+        except Exception as e:
+            print(f"Warning: Error loading chats for profile {profile_key}: {e}")
+        return chats
+
+    _copy_shared_chats(profile_key, user)
+    profile_chat_dir = get_profile_chat_dir(profile_key, user)
     os.makedirs(profile_chat_dir, exist_ok=True)
-    safe_title = "".join(c if c.isalnum() or c in [' ', '-'] else "_" for c in title)
-    file_path = os.path.join(profile_chat_dir, f"{safe_title}.json")
+    return {
+        title: _adopt_header({"messages": messages, SYNCED_KEY: len(messages)}, _apply_defaults(header))
+        for title, (header, messages) in _read_file_chats(profile_chat_dir).items()
+    }
+
+def referenced_gemini_caches():
+    """Names of the Gemini caches any saved chat of any user still refers to, in the database or in chat files not yet imported."""
+    # Errors propagate: a reference that cannot be read must stop the caller from deleting anything.
+    names = set(chat_store.referenced_values("gemini_cache_name"))
+    for dir_path, _, file_names in os.walk(BASE_CHAT_DIR):
+        for file_name in file_names:
+            if not file_name.endswith(HEADER_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(dir_path, file_name), "r") as f:
+                    cache_name = json.load(f).get("gemini_cache_name")
+            except FileNotFoundError:
+                continue  # Removed or replaced since the directory was listed
+            if cache_name:
+                names.add(cache_name)
+    return names
+
+def get_messages(profile_key, title, chat_data, user=None):
+    """
+    The chat's messages. With the sqlite backend only the newest CHAT_HISTORY_WINDOW are fetched, the first time
+    they are needed in this session; load_earlier_messages pages in older ones.
+    """
+    if chat_data.get("messages") is None:
+        try:
+            first_seq, messages = chat_store.load_page(user or "", profile_key, title, limit=CHAT_HISTORY_WINDOW)
+        except Exception as e:
+            print(f"Warning: Error loading messages of chat {title}: {e}")
+            return []
+        chat_data["messages"] = messages
+        chat_data[SYNCED_KEY] = len(messages)
+        chat_data[FIRST_SEQ_KEY] = first_seq
+    return chat_data["messages"]
+
+def earlier_message_count(chat_data):
+    """Number of the chat's stored messages older than those loaded into chat_data."""
+    return chat_data.get(FIRST_SEQ_KEY, 0) if chat_data.get("messages") is not None else 0
+
+def load_earlier_messages(profile_key, title, chat_data, user=None, limit=CHAT_HISTORY_WINDOW):
+    """Prepend up to limit (all, if None) older stored messages to chat_data["messages"]; returns how many were loaded."""
+    messages = get_messages(profile_key, title, chat_data, user)
+    if earlier_message_count(chat_data) <= 0:
+        return 0
     try:
-        with open(file_path, "w") as f:
-            json.dump(chat_data, f, indent=2)
+        first_seq, earlier = chat_store.load_page(
+            user or "", profile_key, title, limit=limit, before_seq=chat_data[FIRST_SEQ_KEY]
+        )
     except Exception as e:
-        print(f"Error saving chat file {file_path}: {e}")
\ No newline at end of file
+        print(f"Warning: Error loading earlier messages of chat {title}: {e}")
+        return 0
+    messages[:0] = earlier
+    chat_data[SYNCED_KEY] = chat_data.get(SYNCED_KEY, 0) + len(earlier)
+    chat_data[FIRST_SEQ_KEY] = first_seq
+    return len(earlier)
+
+def save_chat(profile_key, title, chat_data, user=None):
+    """
+    Persist chat_data: messages added since the last save are appended after whatever the store already holds
+    (including turns written meanwhile by another worker), and the header fields this session changed are merged into
+    the stored header. chat_data then picks up the fields other sessions changed.
+    """
+    messages = chat_data.get("messages")
+    synced = min(chat_data.get(SYNCED_KEY, 0), len(messages)) if messages is not None else 0
+    new_messages = messages[synced:] if messages is not None else []
+    header_changes = _header_changes(chat_data)
+
+    if CHAT_STORE_BACKEND == "sqlite":
+        try:
+            header = chat_store.save_chat(user or "", profile_key, title, header_changes, new_messages)
+        except Exception as e:
+            print(f"Error saving chat {title} for profile {profile_key}: {e}")
+            return
+        _adopt_header(chat_data, header)
+        if messages is not None:
+            chat_data[SYNCED_KEY] = len(messages)
+        return
+
+    base_path = _chat_base_path(profile_key, title, user)
+    os.makedirs(os.path.dirname(base_path), exist_ok=True)
+    compact_needed = False
+    try:
+        with _locked(base_path):
+            state = _current_state(base_path)
+            if new_messages:
+                with open(base_path + LOG_SUFFIX, "a") as f:
+                    for offset, message in enumerate(new_messages):
+                        f.write(json.dumps({"epoch": state["epoch"], "seq": state["count"] + offset, "message": message}) + "\n")
+                    f.flush()
+                    if CHAT_LOG_FSYNC_POLICY == "always" or time.time() - state["last_fsync"] >= CHAT_LOG_FSYNC_INTERVAL_SECONDS:
+                        os.fsync(f.fileno())
+                        state["last_fsync"] = time.time()
+                state["log_records"] += len(new_messages)
+                state["count"] += len(new_messages)
+                state["version"] = _disk_version(base_path)
+                compact_needed = state["log_records"] >= CHAT_LOG_COMPACT_THRESHOLD
+
+            stored_header = _read_header(base_path)
+            header = dict(stored_header, **header_changes)
+            if header != stored_header or not os.path.exists(base_path + HEADER_SUFFIX):
+                _write_json_atomic(base_path + HEADER_SUFFIX, dict(header, title=title))
+    except Exception as e:
+        print(f"Error saving chat file {base_path}: {e}")
+        return
+
+    _adopt_header(chat_data, header)
+    if messages is not None:
+        chat_data[SYNCED_KEY] = len(messages)
+    if compact_needed:
+        _compactor.submit(_compact, base_path)
+
+def clear_chat(profile_key, title, chat_data, user=None):
+    """Delete the chat's stored messages but keep its header; chat_data's messages are emptied in place."""
+    chat_data["messages"] = []
+    chat_data[SYNCED_KEY] = 0
+    chat_data[FIRST_SEQ_KEY] = 0
+    header_changes = _header_changes(chat_data)
+
+    if CHAT_STORE_BACKEND == "sqlite":
+        try:
+            _adopt_header(chat_data, chat_store.clear_chat(user or "", profile_key, title, header_changes))
+        except Exception as e:
+            print(f"Error clearing chat {title} for profile {profile_key}: {e}")
+        return
+
+    base_path = _chat_base_path(profile_key, title, user)
+    os.makedirs(os.path.dirname(base_path), exist_ok=True)
+    try:
+        with _locked(base_path):
+            state = _current_state(base_path)
+            # A new epoch makes log records that survive a crash before the truncation unreadable.
+            _write_snapshot(base_path, state["epoch"] + 1, [])
+            header = dict(_read_header(base_path), **header_changes)
+            _write_json_atomic(base_path + HEADER_SUFFIX, dict(header, title=title))
+            state.update({
+                "epoch": state["epoch"] + 1, "count": 0, "log_records": 0,
+                "version": _disk_version(base_path),
+            })
+    except Exception as e:
+        print(f"Error clearing chat file {base_path}: {e}")
+        return
+
+    _adopt_header(chat_data, header)
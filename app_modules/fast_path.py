@@ -0,0 +1,558 @@
+# app_modules/fast_path.py
+import re
+import pandas as pd
+from . import statement_parsers
+from .statement_parsers import FORMAT_MONARCH, FORMAT_KUNVARJI, FORMAT_NIRMAL_BANG, FORMAT_CDSL_CAS
+
+SEGMENT_LABELS = {"Cash": "Cash", "FNO": "F&O", "Currency": "Currency", "Commodity": "Commodity"}
+# Trade sections ("Cash Segment Short Term Transactions", "F&O Gains", ...) by the segment they belong to.
+SECTION_PREFIXES = {"Cash": "Cash Segment", "FNO": "F&O", "Currency": "Currency", "Commodity": "Commodity"}
+TAX_EXPENSE_PATTERN = re.compile(r"GST|\bSTT\b|STAMP DUTY", re.IGNORECASE)
+PNL_TOTAL_ITEMS = ("Total (A)", "Total (B)", "Grand Total (A-B)")
+# CAS scheme names start with the fund house's scheme code: "92 - Aditya Birla Sun Life ...", "099G - SBI ...".
+SCHEME_CODE_PATTERN = re.compile(r"^[A-Za-z0-9]{1,8}\s+-\s+")
+
+
+def normalize_question(question):
+    return re.sub(r"[^a-z0-9&]+", " ", str(question).lower()).strip()
+
+
+def format_inr(value):
+    """Indian digit grouping: 600415.55 -> '₹6,00,415.55'."""
+    sign = "-" if value < 0 else ""
+    whole, fraction = f"{abs(value):.2f}".split(".")
+    if len(whole) > 3:
+        head, tail = whole[:-3], whole[-3:]
+        head = ",".join(re.findall(r"\d{1,2}", head[::-1]))[::-1]
+        whole = f"{head},{tail}"
+    return f"{sign}₹{whole}.{fraction}"
+
+
+def format_quantity(value):
+    return f"{value:,.0f}" if float(value).is_integer() else f"{value:,.3f}"
+
+
+def cite(pages):
+    pages = sorted({int(p) for p in pages})
+    if len(pages) == 1:
+        return f"(Page: {pages[0]})"
+    return f"(Pages: {', '.join(str(p) for p in pages)})"
+
+
+def _row(df, item):
+    rows = df[df["item"] == item]
+    return rows.iloc[0].fillna(0) if not rows.empty else None
+
+
+def _active_segments(statement):
+    """Segments with either gains or expenses in the statement."""
+    gains, expenses = _row(statement["summary"], "Total (A)"), _row(statement["expenses"], "Total (B)")
+    if gains is None or expenses is None:
+        return None
+    return [
+        segment for segment in SEGMENT_LABELS
+        if gains[segment] != 0 or expenses[segment] != 0
+    ]
+
+
+def _cash_trades(statement):
+    trades = statement["trades"]
+    if trades.empty:
+        return trades
+    return trades[trades["section"].fillna("").str.startswith("Cash Segment")]
+
+
+def _trade_segment(section):
+    for segment, prefix in SECTION_PREFIXES.items():
+        if str(section).startswith(prefix):
+            return segment
+    return None
+
+
+def _largest_by_isin(df, quantity_column):
+    if df.empty or "ISIN" not in df.columns:
+        return None
+    totals = df.groupby("ISIN").agg(
+        name=("Stock Name", "first"), quantity=(quantity_column, "sum"), pages=("page", lambda p: sorted(set(p)))
+    )
+    totals = totals[totals["quantity"] > 0]
+    if totals.empty:
+        return None
+    return totals.sort_values("quantity", ascending=False).iloc[0]
+
+
+# --- Monarch / Kunvarji P&L statements ---
+
+def _pnl_date_range(statement):
+    period = statement["period"]
+    if not period:
+        return None
+    return f"The statement covers the period from {period['from']} to {period['to']} {cite([period['page']])}."
+
+
+def _pnl_grand_total(statement):
+    grand_total = _row(statement["expenses"], "Grand Total (A-B)")
+    gains, expenses = _row(statement["summary"], "Total (A)"), _row(statement["expenses"], "Total (B)")
+    if grand_total is None or gains is None or expenses is None:
+        return None
+    outcome = "profit" if grand_total["Total"] >= 0 else "loss"
+    return (
+        f"You made an overall net {outcome}. Your grand total (A-B) was {format_inr(grand_total['Total'])}: "
+        f"total gain/loss (A) of {format_inr(gains['Total'])} less total expenses (B) of "
+        f"{format_inr(expenses['Total'])} {cite([grand_total['page'], gains['page']])}."
+    )
+
+
+def _pnl_most_profitable_segment(statement):
+    gains = _row(statement["summary"], "Total (A)")
+    if gains is None:
+        return None
+    best = max(SEGMENT_LABELS, key=lambda segment: gains[segment])
+    if gains[best] <= 0:
+        return f"None of your segments made a profit; the Total (A) row shows no positive segment {cite([gains['page']])}."
+    return (
+        f"Your most profitable segment was {SEGMENT_LABELS[best]}, with a total gain of "
+        f"{format_inr(gains[best])} {cite([gains['page']])}."
+    )
+
+
+def _pnl_tax_spent(statement):
+    expenses = statement["expenses"]
+    taxes = expenses[expenses["item"].str.contains(TAX_EXPENSE_PATTERN) & ~expenses["item"].isin(PNL_TOTAL_ITEMS)].fillna(0)
+    if taxes.empty:
+        return None
+    lines = [f"- {row['item']}: {format_inr(row['Total'])}" for _, row in taxes.iterrows()]
+    return (
+        f"Overall you spent {format_inr(taxes['Total'].sum())} on taxes {cite(taxes['page'])}:\n"
+        + "\n".join(lines)
+    )
+
+
+def _pnl_highest_realized_gain_per_segment(statement):
+    trades, gains = statement["trades"], _row(statement["summary"], "Total (A)")
+    if trades.empty or gains is None:
+        return None
+    segments = trades["section"].map(_trade_segment)
+    lines = []
+    for segment, label in SEGMENT_LABELS.items():
+        group = trades[segments == segment].dropna(subset=["Realized Gain"])
+        if group.empty:
+            if gains[segment] != 0:
+                return None  # The summary shows a result for a segment whose trades were not parsed
+            continue
+        best = group.loc[group["Realized Gain"].idxmax()]
+        if best["Realized Gain"] <= 0:
+            lines.append(f"- {label}: no stock had a realized gain {cite(group['page'])}")
+            continue
+        lines.append(
+            f"- {label}: {best['Stock Name']} with a realized gain of "
+            f"{format_inr(best['Realized Gain'])} {cite([best['page']])}"
+        )
+    if not lines:
+        return None
+    return "Highest realized gain in each segment:\n" + "\n".join(lines)
+
+
+def _pnl_highest_bought_quantity(statement):
+    best = _largest_by_isin(_cash_trades(statement), "Buy Qty")
+    if best is None:
+        return None
+    return (
+        f"You bought the highest quantity of {best['name']}: {format_quantity(best['quantity'])} shares "
+        f"across your cash-segment trades {cite(best['pages'])}."
+    )
+
+
+def _pnl_highest_sold_quantity(statement):
+    best = _largest_by_isin(_cash_trades(statement), "Sell Qty")
+    if best is None:
+        return None
+    return (
+        f"You sold the highest quantity of {best['name']}: {format_quantity(best['quantity'])} shares "
+        f"across your cash-segment trades {cite(best['pages'])}."
+    )
+
+
+def _pnl_highest_notional_gain(statement):
+    candidates = [df for df in (statement["holdings"], statement["open_positions"]) if not df.empty]
+    if not candidates:
+        return None
+    best = max((df.loc[df["Notional Gain"].idxmax()] for df in candidates), key=lambda row: row["Notional Gain"])
+    if best["Notional Gain"] <= 0:
+        pages = pd.concat([df["page"] for df in candidates])
+        return f"None of your holdings or open positions shows a notional gain {cite(pages)}."
+    return (
+        f"{best['Stock Name']} has the highest notional gain, at {format_inr(best['Notional Gain'])} "
+        f"{cite([best['page']])}."
+    )
+
+
+def _pnl_segment_losses(statement):
+    gains = _row(statement["summary"], "Total (A)")
+    if gains is None:
+        return None
+    losses = [segment for segment in SEGMENT_LABELS if gains[segment] < 0]
+    if not losses:
+        return f"No, none of your segments shows a loss in the Total (A) row {cite([gains['page']])}."
+    lines = [f"- {SEGMENT_LABELS[segment]}: {format_inr(gains[segment])}" for segment in losses]
+    return f"Yes, you incurred a loss in the following segment(s) {cite([gains['page']])}:\n" + "\n".join(lines)
+
+
+def _pnl_greatest_expense(statement):
+    expenses = statement["expenses"]
+    expenses = expenses[~expenses["item"].isin(PNL_TOTAL_ITEMS)].dropna(subset=["Total"])
+    if expenses.empty:
+        return None
+    best = expenses.loc[expenses["Total"].idxmax()]
+    return f"Your greatest expense was {best['item']}, at {format_inr(best['Total'])} {cite([best['page']])}."
+
+
+def _pnl_expense_above_gain(statement):
+    gains, expenses = _row(statement["summary"], "Total (A)"), _row(statement["expenses"], "Total (B)")
+    segments = _active_segments(statement)
+    if segments is None:
+        return None
+    above = [segment for segment in segments if expenses[segment] > gains[segment]]
+    pages = [gains["page"], expenses["page"]]
+    if not above:
+        return f"No, in every segment your gain was higher than your expenses {cite(pages)}."
+    lines = [
+        f"- {SEGMENT_LABELS[segment]}: expenses of {format_inr(expenses[segment])} against a gain/loss of "
+        f"{format_inr(gains[segment])}"
+        for segment in above
+    ]
+    return f"Yes, expenses exceeded the gain in the following segment(s) {cite(pages)}:\n" + "\n".join(lines)
+
+
+def _pnl_largest_fno_loss(statement):
+    trades = statement["trades"]
+    fno = trades[trades["section"] == "F&O Gains"] if not trades.empty else trades
+    if fno.empty:
+        return None
+    worst = fno.loc[fno["Realized Gain"].idxmin()]
+    if worst["Realized Gain"] >= 0:
+        return f"None of your F&O transactions was loss-making {cite(fno['page'])}."
+    return (
+        f"Your largest single F&O loss was {format_inr(worst['Realized Gain'])} on {worst['Stock Name']} "
+        f"{cite([worst['page']])}."
+    )
+
+
+def _pnl_largest_notional_loss(statement):
+    holdings = statement["holdings"]
+    if holdings.empty:
+        return None
+    worst = holdings.loc[holdings["Notional Gain"].idxmin()]
+    if worst["Notional Gain"] >= 0:
+        return f"None of your holdings shows a notional loss {cite(holdings['page'])}."
+    return (
+        f"{worst['Stock Name']} shows the largest notional loss, at {format_inr(worst['Notional Gain'])} "
+        f"{cite([worst['page']])}."
+    )
+
+
+def _pnl_held_buy_value(statement):
+    holdings = statement["holdings"]
+    if holdings.empty:
+        return None
+    return (
+        f"The total buy value of the assets currently held is {format_inr(holdings['Buy Total'].sum())} "
+        f"across {len(holdings)} holdings {cite(holdings['page'])}."
+    )
+
+
+def _pnl_open_positions(statement):
+    positions = statement["open_positions"]
+    if positions.empty:
+        return None
+    lines = [
+        f"- {row['Stock Name']} ({row['section']}): net quantity {format_quantity(row['Net Qty'])}, "
+        f"notional P&L {format_inr(row['Notional Gain'])}"
+        for _, row in positions.iterrows()
+    ]
+    return (
+        f"Yes, you have {len(positions)} open position(s) with a total notional P&L of "
+        f"{format_inr(positions['Notional Gain'].sum())} {cite(positions['page'])}:\n" + "\n".join(lines)
+    )
+
+
+def _pnl_biggest_short_term_profit(statement):
+    trades = _cash_trades(statement)
+    short_term = trades[trades["section"].str.contains("Short Term")] if not trades.empty else trades
+    if short_term.empty:
+        return None
+    best = short_term.loc[short_term["Realized Gain"].idxmax()]
+    return (
+        f"Your biggest profit from a single short-term stock trade was {format_inr(best['Realized Gain'])} "
+        f"on {best['Stock Name']} {cite([best['page']])}."
+    )
+
+
+def _pnl_most_profitable_trade(statement):
+    trades = statement["trades"]
+    if trades.empty:
+        return None
+    best = trades.loc[trades["Realized Gain"].idxmax()]
+    return (
+        f"Your single most profitable trade was {best['Stock Name']} ({best['section']}), with a realized gain "
+        f"of {format_inr(best['Realized Gain'])} {cite([best['page']])}."
+    )
+
+
+# --- Nirmal Bang ITR statements ---
+
+def _nb_total(statement, category):
+    totals = statement["holding_totals"]
+    rows = totals[totals["category"].str.lower() == category.lower()]
+    return rows.iloc[0] if not rows.empty else None
+
+
+def _nb_holdings(statement):
+    holdings = statement["holdings"]
+    if holdings.empty:
+        return None
+    lines = [
+        f"- {row['name']} ({row['category']}): {format_quantity(row['quantity'])} shares valued at "
+        f"{format_inr(row['value'])}"
+        for _, row in holdings.iterrows()
+    ]
+    return f"You currently hold {len(holdings)} securities {cite(holdings['page'])}:\n" + "\n".join(lines)
+
+
+def _nb_company_names(statement):
+    holdings = statement["holdings"]
+    if holdings.empty:
+        return None
+    names = list(dict.fromkeys(holdings["name"]))
+    return (
+        f"You have invested in the following {len(names)} companies {cite(holdings['page'])}:\n"
+        + "\n".join(f"- {name}" for name in names)
+    )
+
+
+def _nb_total_value(statement):
+    grand_total = _nb_total(statement, "Grand Total")
+    if grand_total is None:
+        return None
+    return f"The total value of your investments is {format_inr(grand_total['value'])} {cite([grand_total['page']])}."
+
+
+def _nb_category_value(category):
+    def handler(statement):
+        if statement["holdings"].empty:
+            return None
+        total = _nb_total(statement, category)
+        if total is None:
+            return f"You do not have any '{category}' holdings in this statement {cite(statement['holdings']['page'])}."
+        return f"The value of your '{category}' holdings is {format_inr(total['value'])} {cite([total['page']])}."
+    return handler
+
+
+def _nb_capital_gain(prefix, label):
+    def handler(statement):
+        gains = statement["capital_gains"]
+        rows = gains[gains["type"].str.startswith(prefix)]
+        if rows.empty:
+            return None
+        row = rows.iloc[0]
+        outcome = "gain" if row["realized_gain"] >= 0 else "loss"
+        return (
+            f"Your total {label} was {format_inr(row['realized_gain'])}, a net {outcome} "
+            f"(taxable: {format_inr(row['taxable_gain'])}) on a buy value of {format_inr(row['buy_value'])} and "
+            f"a sell value of {format_inr(row['sell_value'])} {cite([row['page']])}."
+        )
+    return handler
+
+
+# --- CDSL consolidated account statements ---
+
+def _cas_allocation(statement, asset_class):
+    allocation = statement["asset_allocation"]
+    rows = allocation[allocation["asset_class"] == asset_class]
+    return rows.iloc[0] if not rows.empty else None
+
+
+def _cas_total_value(statement):
+    total = _cas_allocation(statement, "Total")
+    if total is None:
+        return None
+    return (
+        f"The total value of your investments as of the statement date is {format_inr(total['value'])} "
+        f"{cite([total['page']])}."
+    )
+
+
+def _cas_portfolio_change(statement):
+    history = statement["portfolio_history"].dropna(subset=["value"])
+    if len(history) < 2:
+        return None
+    first, last = history.iloc[0], history.iloc[-1]
+    change = last["value"] - first["value"]
+    direction = "increased" if change >= 0 else "decreased"
+    return (
+        f"Your portfolio value {direction} from {format_inr(first['value'])} in {first['month']} to "
+        f"{format_inr(last['value'])} in {last['month']}, a change of {format_inr(change)} "
+        f"({change / first['value'] * 100:.2f}%) {cite(history['page'])}."
+    )
+
+
+def _cas_asset_breakdown(statement):
+    allocation = statement["asset_allocation"]
+    classes = allocation[allocation["asset_class"] != "Total"]
+    if classes.empty or _cas_allocation(statement, "Total") is None:
+        return None
+    lines = [
+        f"- {row['asset_class']}: {format_inr(row['value'])} ({row['percentage']:.2f}%)"
+        for _, row in classes.iterrows()
+    ]
+    return f"Your investments are split across asset classes as follows {cite(allocation['page'])}:\n" + "\n".join(lines)
+
+
+def _cas_stock_value(statement):
+    equity = _cas_allocation(statement, "Equity")
+    if equity is None:
+        return None
+    return f"The total value of your stock (equity) holdings is {format_inr(equity['value'])} {cite([equity['page']])}."
+
+
+def _cas_nps_value(statement):
+    nps = _cas_allocation(statement, "NPS")
+    if nps is None:
+        return None
+    return f"The current value of your NPS account is {format_inr(nps['value'])} {cite([nps['page']])}."
+
+
+def _scheme_name(scheme):
+    return SCHEME_CODE_PATTERN.sub("", str(scheme)).strip()
+
+
+def _schemes_across_folios(statement):
+    """Mutual fund rows merged per scheme: the same scheme held in several folios is one scheme, its amounts summed."""
+    funds = statement["mutual_funds"]
+    if funds.empty:
+        return None
+    funds = funds.assign(scheme=funds["scheme"].map(_scheme_name))
+    return funds.groupby("scheme", sort=False).agg(
+        folios=("folio", lambda folios: list(dict.fromkeys(folios))),
+        invested=("invested", lambda values: values.sum(min_count=1)),
+        value=("value", lambda values: values.sum(min_count=1)),
+        pages=("page", lambda pages: sorted(set(pages))),
+    ).reset_index()
+
+
+def _folio_note(folios):
+    return f"Folio {folios[0]}" if len(folios) == 1 else f"{len(folios)} folios: {', '.join(str(folio) for folio in folios)}"
+
+
+def _cas_mutual_fund_schemes(statement):
+    schemes = _schemes_across_folios(statement)
+    if schemes is None:
+        return None
+    folio_count = len({folio for folios in schemes["folios"] for folio in folios})
+    return (
+        f"You are invested in the following {len(schemes)} mutual fund schemes, held across {folio_count} folios "
+        f"{cite(statement['mutual_funds']['page'])}:\n"
+        + "\n".join(f"- {row['scheme']} ({_folio_note(row['folios'])})" for _, row in schemes.iterrows())
+    )
+
+
+def _cas_mutual_fund_value(statement):
+    rows = [
+        row for row in (
+            _cas_allocation(statement, "Mutual Fund Folios"),
+            _cas_allocation(statement, "Mutual Funds Held in Demat Form"),
+        )
+        if row is not None
+    ]
+    if not rows:
+        return None
+    lines = [f"- {row['asset_class']}: {format_inr(row['value'])}" for row in rows]
+    return (
+        f"The total value of all your mutual fund investments is {format_inr(sum(row['value'] for row in rows))} "
+        f"{cite([row['page'] for row in rows])}:\n" + "\n".join(lines)
+    )
+
+
+def _cas_mutual_fund_invested_vs_value(statement):
+    schemes = _schemes_across_folios(statement)
+    if schemes is None:
+        return None
+    schemes = schemes.dropna(subset=["invested", "value"])
+    if schemes.empty:
+        return None
+    lines = [
+        f"- {row['scheme']} ({_folio_note(row['folios'])}): invested {format_inr(row['invested'])}, "
+        f"current value {format_inr(row['value'])}"
+        for _, row in schemes.iterrows()
+    ]
+    return (
+        f"Amount invested and current value for each of your {len(schemes)} mutual fund schemes, summed across "
+        f"folios where a scheme is held in more than one {cite([page for pages in schemes['pages'] for page in pages])}:\n"
+        + "\n".join(lines)
+    )
+
+
+PNL_HANDLERS = {
+    "What is the date range of the given statement?": _pnl_date_range,
+    "Did i make an overall profit or loss? What was my grand total?": _pnl_grand_total,
+    "What was my most profitable segment?": _pnl_most_profitable_segment,
+    "Overall, how much did i spend on tax?": _pnl_tax_spent,
+    "In each segment, which stock gave me the highest realized gain?": _pnl_highest_realized_gain_per_segment,
+    "Which stock have i bought the highest quantity of?": _pnl_highest_bought_quantity,
+    "Which stock have i sold the highest quantity of?": _pnl_highest_sold_quantity,
+    "Which of my assets has the highest notional gain?": _pnl_highest_notional_gain,
+    "Did i incur a loss in any segment?": _pnl_segment_losses,
+    "What was my greatest expense?": _pnl_greatest_expense,
+    "Did any segment have a higher expense than gain?": _pnl_expense_above_gain,
+    "What was the largest single loss from an F&O transaction?": _pnl_largest_fno_loss,
+    "Which stock holding shows the largest notional loss as of the statement date?": _pnl_largest_notional_loss,
+    "What is the total buy value of the assets currently held?": _pnl_held_buy_value,
+    "Are there any open positions in F&O or Commodities, and what is their notional P&L?": _pnl_open_positions,
+    "What was the single biggest profit made from one short-term stock trade listed?": _pnl_biggest_short_term_profit,
+    "what is my single most profitable trade": _pnl_most_profitable_trade,
+}
+
+NIRMAL_BANG_HANDLERS = {
+    "What investments do I currently hold?": _nb_holdings,
+    "Can you list the names of all the companies I have invested in?": _nb_company_names,
+    "What is the total value of my investments?": _nb_total_value,
+    "What is the value of my 'Free Balance' holdings?": _nb_category_value("Free Balance"),
+    "What is the value of my 'Pledge' holdings?": _nb_category_value("Pledge"),
+    "What are my total short-term capital gains/losses?": _nb_capital_gain("Short Term", "short-term capital gain/loss"),
+    "What are my total long-term capital gains/losses?": _nb_capital_gain("Long Term", "long-term capital gain/loss"),
+    "What is my total speculative profit or loss?": _nb_capital_gain("Speculation", "speculative profit/loss"),
+}
+
+CDSL_CAS_HANDLERS = {
+    "What is the total value of my investments as of the statement date?": _cas_total_value,
+    "How has the value of my portfolio changed over the past year?": _cas_portfolio_change,
+    "What is the percentage breakdown of my investments across different asset classes like equity and debt?": _cas_asset_breakdown,
+    "What is the total value of my stock holdings?": _cas_stock_value,
+    "Which mutual fund schemes am I invested in?": _cas_mutual_fund_schemes,
+    "What is the total value of all my mutual fund investments?": _cas_mutual_fund_value,
+    "For each given mutual fund, what is the initial investment amount and what is its current value?": _cas_mutual_fund_invested_vs_value,
+    "What is the current value of my NPS account?": _cas_nps_value,
+}
+
+HANDLERS_BY_FORMAT = {
+    statement_format: {normalize_question(question): handler for question, handler in handlers.items()}
+    for statement_format, handlers in {
+        FORMAT_MONARCH: PNL_HANDLERS,
+        FORMAT_KUNVARJI: PNL_HANDLERS,
+        FORMAT_NIRMAL_BANG: NIRMAL_BANG_HANDLERS,
+        FORMAT_CDSL_CAS: CDSL_CAS_HANDLERS,
+    }.items()
+}
+
+
+def answer_question(pdf_path, question):
+    """Answer for a known profile question computed from the parsed statement, or None to defer to the model."""
+    try:
+        statement = statement_parsers.parse_statement(pdf_path)
+        if statement is None:
+            return None
+        handler = HANDLERS_BY_FORMAT[statement["format"]].get(normalize_question(question))
+        return handler(statement) if handler else None
+    except Exception as e:
+        print(f"Warning: Fast path failed for '{question}' on {pdf_path}: {e}")
+        return None
@@ -1,30 +1,26 @@
-import yfinance as yf
 import datetime
 import json
 from google.genai import types as gemini_types
+from . import price_analytics, price_resampling, price_store, symbol_resolver, trading_calendar
+from .app_config import PRICE_RANGE_DEFAULT_MAX_POINTS
 
 
-def get_historical_stock_price_impl(ticker_symbol: str, date_str: str):
+def get_historical_stock_price_impl(ticker_symbol: str, date_str: str, snap: str = trading_calendar.SNAP_PREVIOUS):
     try:
+        requested_symbol = ticker_symbol
+        ticker_symbol = symbol_resolver.resolve_ticker(ticker_symbol)
         target_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-        stock = yf.Ticker(ticker_symbol)
-        hist = stock.history(
-            start=target_date.strftime("%Y-%m-%d"),
-            end=(target_date + datetime.timedelta(days=2)).strftime("%Y-%m-%d"),
-        )
+        session_date = trading_calendar.resolve_session_for_symbol(ticker_symbol, target_date, snap)
+        hist = price_store.get_price_history(ticker_symbol, session_date, session_date)
 
         if hist.empty:
             return json.dumps(
-                {"error": f"No data found for {ticker_symbol} around {date_str}."}
-            )
-        data_for_date_df = hist[hist.index.date == target_date]
-        if data_for_date_df.empty:
-            return json.dumps(
-                {"error": f"No trading data for {ticker_symbol} on {date_str}."}
+                {"error": f"No trading data for {ticker_symbol} on {session_date.isoformat()}."}
             )
-        data = data_for_date_df.iloc[0]
+        data = hist.iloc[0]
         result = {
-            "date": date_str,
+            "date": session_date.isoformat(),
+            "requested_date": date_str,
             "ticker": ticker_symbol,
             "open": data.get("Open"),
             "high": data.get("High"),
@@ -32,31 +28,153 @@ def get_historical_stock_price_impl(ticker_symbol: str, date_str: str):
             "close": data.get("Close"),
             "volume": data.get("Volume"),
         }
+        if session_date != target_date:
+            result["note"] = (
+                f"{date_str} was not a trading session; "
+                f"used the {snap} session on {session_date.isoformat()}."
+            )
+        if ticker_symbol != requested_symbol:
+            result["resolved_from"] = requested_symbol
+        special_session = trading_calendar.get_special_session(session_date)
+        if special_session:
+            result["session"] = special_session
         return json.dumps(result)
     except Exception as e:
         return json.dumps({"error": f"An error occurred: {str(e)}"})
 
 
-def get_historical_price_range_impl(ticker_symbol: str, start_date: str, end_date: str):
+def get_historical_price_range_impl(ticker_symbol: str, start_date: str, end_date: str, resample: str = None, max_points: int = None):
     try:
-        stock = yf.Ticker(ticker_symbol)
-        hist = stock.history(start=start_date, end=end_date)
+        ticker_symbol = symbol_resolver.resolve_ticker(ticker_symbol)
+        range_start = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+        range_end = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
+        if max_points is not None and int(max_points) < price_resampling.MIN_LTTB_POINTS:
+            return json.dumps({"error": f"max_points must be at least {price_resampling.MIN_LTTB_POINTS}."})
+        # end_date stays exclusive, matching the yfinance semantics the tool always had.
+        hist = price_store.get_price_history(
+            ticker_symbol, range_start, range_end - datetime.timedelta(days=1)
+        )
         if hist.empty:
             return json.dumps(
                 {
                     "error": f"No data found for {ticker_symbol} in the range {start_date} to {end_date}."
                 }
             )
-        hist = hist.reset_index()
-        hist = hist[["Date", "Close"]]
+        if max_points is None and resample is None:
+            max_points = PRICE_RANGE_DEFAULT_MAX_POINTS
+        source_rows = len(hist)
+        hist, resolution = price_resampling.downsample(
+            hist, resolution=resample, max_points=int(max_points) if max_points else None
+        )
+        columns = ["Date", "Close"] if resolution.split("+")[0] == price_resampling.RESAMPLE_DAILY else ["Date", "Open", "High", "Low", "Close"]
+        hist = hist.reset_index()[columns]
         hist["Date"] = hist["Date"].dt.strftime("%Y-%m-%d")
-        return hist.to_json(orient="records")
+        if resolution == price_resampling.RESAMPLE_DAILY:
+            return hist.to_json(orient="records")
+        return json.dumps({
+            "resolution": resolution,
+            "source_rows": source_rows,
+            "data": json.loads(hist.round(2).to_json(orient="records")),
+        })
     except Exception as e:
         return json.dumps({"error": f"An unexpected error occurred: {str(e)}"})
 
 
-def get_historical_index_value_impl(index_symbol: str, date_str: str):
-    return get_historical_stock_price_impl(index_symbol, date_str)
+def get_historical_prices_batch_impl(ticker_symbols: list, dates: list, snap: str = trading_calendar.SNAP_PREVIOUS):
+    try:
+        target_dates = sorted(
+            {datetime.datetime.strptime(date_str, "%Y-%m-%d").date() for date_str in dates}
+        )
+        if not ticker_symbols or not target_dates:
+            return json.dumps({"error": "At least one ticker symbol and one date are required."})
+
+        resolved_symbols = {symbol: symbol_resolver.resolve_ticker(symbol) for symbol in ticker_symbols}
+        ticker_symbols = list(dict.fromkeys(resolved_symbols.values()))
+
+        session_dates = {
+            (ticker_symbol, target_date): trading_calendar.resolve_session_for_symbol(ticker_symbol, target_date, snap)
+            for ticker_symbol in ticker_symbols
+            for target_date in target_dates
+        }
+        histories = price_store.get_price_history_batch(
+            ticker_symbols, min(session_dates.values()), max(session_dates.values()),
+            days=set(session_dates.values()),
+        )
+        rows = []
+        missing = []
+        for ticker_symbol, hist in histories.items():
+            for target_date in target_dates:
+                session_date = session_dates[(ticker_symbol, target_date)]
+                day_rows = hist[hist.index.date == session_date]
+                if day_rows.empty:
+                    missing.append([ticker_symbol, target_date.isoformat()])
+                    continue
+                data = day_rows.iloc[0]
+                rows.append([
+                    ticker_symbol, target_date.isoformat(), session_date.isoformat(),
+                    data["Open"], data["High"], data["Low"], data["Close"], data["Volume"],
+                ])
+        result = {
+            "columns": ["ticker", "requested_date", "date", "open", "high", "low", "close", "volume"],
+            "rows": rows,
+        }
+        if missing:
+            result["no_trading_data"] = missing
+        renamed = {symbol: ticker for symbol, ticker in resolved_symbols.items() if symbol != ticker}
+        if renamed:
+            result["resolved_symbols"] = renamed
+        return json.dumps(result)
+    except Exception as e:
+        return json.dumps({"error": f"An unexpected error occurred: {str(e)}"})
+
+
+def get_price_performance_impl(ticker_symbol: str, start_date: str, end_date: str, benchmark_symbol: str = None):
+    try:
+        requested_symbol = ticker_symbol
+        ticker_symbol = symbol_resolver.resolve_ticker(ticker_symbol)
+        range_start = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+        range_end = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
+        if benchmark_symbol:
+            benchmark_symbol = symbol_resolver.resolve_ticker(benchmark_symbol)
+        elif ticker_symbol.upper().endswith(".BO"):
+            benchmark_symbol = "^BSESN"
+        elif trading_calendar.is_indian_symbol(ticker_symbol) and ticker_symbol.upper() != "^NSEI":
+            benchmark_symbol = "^NSEI"
+
+        symbols = [ticker_symbol] + ([benchmark_symbol] if benchmark_symbol and benchmark_symbol != ticker_symbol else [])
+        histories = price_store.get_price_history_batch(symbols, range_start, range_end)
+        closes = histories[ticker_symbol]["Close"]
+        if len(closes) < 2:
+            return json.dumps(
+                {"error": f"Not enough trading data for {ticker_symbol} between {start_date} and {end_date}."}
+            )
+
+        result = {"ticker": ticker_symbol}
+        if ticker_symbol != requested_symbol:
+            result["resolved_from"] = requested_symbol
+        result.update(price_analytics.summarize_closes(closes))
+        if len(symbols) > 1:
+            relative = price_analytics.compare_to_benchmark(closes, histories[benchmark_symbol]["Close"])
+            if relative:
+                result["benchmark"] = benchmark_symbol
+                result.update(relative)
+        return json.dumps(result)
+    except Exception as e:
+        return json.dumps({"error": f"An unexpected error occurred: {str(e)}"})
+
+
+def resolve_ticker_symbol_impl(query: str, exchange: str = "NSE"):
+    try:
+        matches = symbol_resolver.search_symbols(query, exchange=exchange)
+        if not matches:
+            return json.dumps({"error": f"No listed company or index matches '{query}'."})
+        return json.dumps({"query": query, "matches": matches})
+    except Exception as e:
+        return json.dumps({"error": f"An unexpected error occurred: {str(e)}"})
+
+
+def get_historical_index_value_impl(index_symbol: str, date_str: str, snap: str = trading_calendar.SNAP_PREVIOUS):
+    return get_historical_stock_price_impl(index_symbol, date_str, snap)
 
 
 # --- GEMINI-SPECIFIC TOOL DECLARATIONS ---
@@ -75,6 +193,11 @@ GEMINI_GET_STOCK_PRICE = gemini_types.FunctionDeclaration(
                 type=gemini_types.Type.STRING,
                 description="The date in YYYY-MM-DD format.",
             ),
+            "snap": gemini_types.Schema(
+                type=gemini_types.Type.STRING,
+                enum=["previous", "next", "exact"],
+                description="How to handle a weekend or exchange holiday: use the previous session (default), the next session, or only the exact date.",
+            ),
         },
         required=["ticker_symbol", "date_str"],
     ),
@@ -93,6 +216,11 @@ GEMINI_GET_INDEX_VALUE = gemini_types.FunctionDeclaration(
                 type=gemini_types.Type.STRING,
                 description="The date in YYYY-MM-DD format.",
             ),
+            "snap": gemini_types.Schema(
+                type=gemini_types.Type.STRING,
+                enum=["previous", "next", "exact"],
+                description="How to handle a weekend or exchange holiday: use the previous session (default), the next session, or only the exact date.",
+            ),
         },
         required=["index_symbol", "date_str"],
     ),
@@ -114,11 +242,92 @@ GEMINI_GET_PRICE_RANGE = gemini_types.FunctionDeclaration(
                 type=gemini_types.Type.STRING,
                 description="The end date in YYYY-MM-DD format.",
             ),
+            "resample": gemini_types.Schema(
+                type=gemini_types.Type.STRING,
+                enum=["daily", "weekly", "monthly"],
+                description="Optional bar size. Weekly and monthly return Open/High/Low/Close per period.",
+            ),
+            "max_points": gemini_types.Schema(
+                type=gemini_types.Type.INTEGER,
+                description="Optional maximum number of points to return. When set without 'resample', the finest resolution that fits is chosen and the series is decimated if needed. Must be at least 3.",
+            ),
         },
         required=["ticker_symbol", "start_date", "end_date"],
     ),
 )
 
+GEMINI_GET_PRICES_BATCH = gemini_types.FunctionDeclaration(
+    name="get_historical_prices_batch",
+    description="Fetches historical data for several stock tickers or indices on one or more dates in a single call.",
+    parameters=gemini_types.Schema(
+        type=gemini_types.Type.OBJECT,
+        properties={
+            "ticker_symbols": gemini_types.Schema(
+                type=gemini_types.Type.ARRAY,
+                description="The ticker or index symbols (e.g., ['RELIANCE.NS', 'INFY.NS', '^NSEI']).",
+                items=gemini_types.Schema(type=gemini_types.Type.STRING),
+            ),
+            "dates": gemini_types.Schema(
+                type=gemini_types.Type.ARRAY,
+                description="The dates in YYYY-MM-DD format.",
+                items=gemini_types.Schema(type=gemini_types.Type.STRING),
+            ),
+            "snap": gemini_types.Schema(
+                type=gemini_types.Type.STRING,
+                enum=["previous", "next", "exact"],
+                description="How to handle a weekend or exchange holiday: use the previous session (default), the next session, or only the exact date.",
+            ),
+        },
+        required=["ticker_symbols", "dates"],
+    ),
+)
+
+GEMINI_GET_PRICE_PERFORMANCE = gemini_types.FunctionDeclaration(
+    name="get_price_performance",
+    description="Computes period return, CAGR, annualized volatility, maximum drawdown and performance relative to a benchmark index for a stock or index over a date range. Returns only the summary numbers.",
+    parameters=gemini_types.Schema(
+        type=gemini_types.Type.OBJECT,
+        properties={
+            "ticker_symbol": gemini_types.Schema(
+                type=gemini_types.Type.STRING, description="The stock ticker or index symbol (e.g., 'RELIANCE.NS', '^NSEI')."
+            ),
+            "start_date": gemini_types.Schema(
+                type=gemini_types.Type.STRING,
+                description="The start date in YYYY-MM-DD format.",
+            ),
+            "end_date": gemini_types.Schema(
+                type=gemini_types.Type.STRING,
+                description="The end date in YYYY-MM-DD format (inclusive).",
+            ),
+            "benchmark_symbol": gemini_types.Schema(
+                type=gemini_types.Type.STRING,
+                description="Optional benchmark index. Defaults to '^NSEI' for NSE symbols and '^BSESN' for BSE symbols.",
+            ),
+        },
+        required=["ticker_symbol", "start_date", "end_date"],
+    ),
+)
+
+GEMINI_RESOLVE_TICKER = gemini_types.FunctionDeclaration(
+    name="resolve_ticker_symbol",
+    description="Looks up the ticker symbol for an Indian company name, ISIN code or market index name (e.g., 'RELIANCE INDUSTRIES LTD' -> 'RELIANCE.NS').",
+    parameters=gemini_types.Schema(
+        type=gemini_types.Type.OBJECT,
+        properties={
+            "query": gemini_types.Schema(
+                type=gemini_types.Type.STRING,
+                description="The company name as written in the statement, an ISIN (e.g., 'INE002A01018') or an index name (e.g., 'NIFTY 50').",
+            ),
+            "exchange": gemini_types.Schema(
+                type=gemini_types.Type.STRING,
+                enum=["NSE", "BSE"],
+                description="The exchange to return the ticker for. Defaults to NSE.",
+            ),
+        },
+        required=["query"],
+    ),
+)
+
 # --- OPENAI-SPECIFIC TOOL DECLARATIONS ---
 
 OPENAI_GET_STOCK_PRICE = {
@@ -137,6 +346,11 @@ OPENAI_GET_STOCK_PRICE = {
                     "type": "string",
                     "description": "The date in YYYY-MM-DD format.",
                 },
+                "snap": {
+                    "type": "string",
+                    "enum": ["previous", "next", "exact"],
+                    "description": "How to handle a weekend or exchange holiday: use the previous session (default), the next session, or only the exact date.",
+                },
             },
             "required": ["ticker_symbol", "date_str"],
         },
@@ -158,6 +372,11 @@ OPENAI_GET_INDEX_VALUE = {
                     "type": "string",
                     "description": "The date in YYYY-MM-DD format.",
                 },
+                "snap": {
+                    "type": "string",
+                    "enum": ["previous", "next", "exact"],
+                    "description": "How to handle a weekend or exchange holiday: use the previous session (default), the next session, or only the exact date.",
+                },
             },
             "required": ["index_symbol", "date_str"],
         },
@@ -183,8 +402,96 @@ OPENAI_GET_PRICE_RANGE = {
                     "type": "string",
                     "description": "The end date in YYYY-MM-DD format.",
                 },
+                "resample": {
+                    "type": "string",
+                    "enum": ["daily", "weekly", "monthly"],
+                    "description": "Optional bar size. Weekly and monthly return Open/High/Low/Close per period.",
+                },
+                "max_points": {
+                    "type": "integer",
+                    "description": "Optional maximum number of points to return. When set without 'resample', the finest resolution that fits is chosen and the series is decimated if needed. Must be at least 3.",
+                },
+            },
+            "required": ["ticker_symbol", "start_date", "end_date"],
+        },
+    },
+}
+OPENAI_GET_PRICES_BATCH = {
+    "type": "function",
+    "function": {
+        "name": "get_historical_prices_batch",
+        "description": "Fetches historical data for several stock tickers or indices on one or more dates in a single call.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "ticker_symbols": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "The ticker or index symbols (e.g., ['RELIANCE.NS', 'INFY.NS', '^NSEI']).",
+                },
+                "dates": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "The dates in YYYY-MM-DD format.",
+                },
+                "snap": {
+                    "type": "string",
+                    "enum": ["previous", "next", "exact"],
+                    "description": "How to handle a weekend or exchange holiday: use the previous session (default), the next session, or only the exact date.",
+                },
+            },
+            "required": ["ticker_symbols", "dates"],
+        },
+    },
+}
+OPENAI_GET_PRICE_PERFORMANCE = {
+    "type": "function",
+    "function": {
+        "name": "get_price_performance",
+        "description": "Computes period return, CAGR, annualized volatility, maximum drawdown and performance relative to a benchmark index for a stock or index over a date range. Returns only the summary numbers.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "ticker_symbol": {
+                    "type": "string",
+                    "description": "The stock ticker or index symbol (e.g., 'RELIANCE.NS', '^NSEI').",
+                },
+                "start_date": {
+                    "type": "string",
+                    "description": "The start date in YYYY-MM-DD format.",
+                },
+                "end_date": {
+                    "type": "string",
+                    "description": "The end date in YYYY-MM-DD format (inclusive).",
+                },
+                "benchmark_symbol": {
+                    "type": "string",
+                    "description": "Optional benchmark index. Defaults to '^NSEI' for NSE symbols and '^BSESN' for BSE symbols.",
+                },
             },
             "required": ["ticker_symbol", "start_date", "end_date"],
         },
     },
 }
+OPENAI_RESOLVE_TICKER = {
+    "type": "function",
+    "function": {
+        "name": "resolve_ticker_symbol",
+        "description": "Looks up the ticker symbol for an Indian company name, ISIN code or market index name (e.g., 'RELIANCE INDUSTRIES LTD' -> 'RELIANCE.NS').",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "The company name as written in the statement, an ISIN (e.g., 'INE002A01018') or an index name (e.g., 'NIFTY 50').",
+                },
+                "exchange": {
+                    "type": "string",
+                    "enum": ["NSE", "BSE"],
+                    "description": "The exchange to return the ticker for. Defaults to NSE.",
+                },
+            },
+            "required": ["query"],
+        },
+    },
+}
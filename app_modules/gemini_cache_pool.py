@@ -0,0 +1,162 @@
+# app_modules/gemini_cache_pool.py
+import time
+import hashlib
+import threading
+from .app_config import (
+    GEMINI_CACHE_FAILURE_BACKOFF_SECONDS, GEMINI_CACHE_EXPIRY_MARGIN_SECONDS, GEMINI_CACHE_EXTEND_WITHIN_SECONDS,
+    GEMINI_CACHE_REAPER_INTERVAL_SECONDS,
+)
+from . import pdf_extraction
+
+_entries = {}
+_failures = {}
+_key_locks = {}
+_locks_guard = threading.Lock()
+_reaper = None
+_sweep = None
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _key_lock(key):
+    with _locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def pool_key(pdf_path, model, system_instruction, tool_schema):
+    """Everything baked into a cached content: document bytes, model, system instruction and tool schema."""
+    return (pdf_extraction.file_sha256(pdf_path), model, _digest(system_instruction), _digest(tool_schema))
+
+
+def key_label(key):
+    return _digest("|".join(key))[:16]
+
+
+def _is_live(entry):
+    return entry is not None and entry["expires_at"] - GEMINI_CACHE_EXPIRY_MARGIN_SECONDS > time.time()
+
+
+def _extend_locked(key, extend):
+    """Push out the TTL of a cache that is about to lapse while still in use; drop it if the update fails."""
+    entry = _entries[key]
+    try:
+        entry["expires_at"] = extend(entry["name"])
+    except Exception as e:
+        print(f"Warning: Could not extend Gemini cache {entry['name']}: {e}")
+        del _entries[key]
+
+
+def get_cached(key, extend=None):
+    """Name of a live cache for key, with no network round trip unless its TTL needs extending; None otherwise."""
+    entry = _entries.get(key)
+    if not _is_live(entry):
+        return None
+    entry["last_used"] = time.time()
+    if extend is None or entry["expires_at"] - time.time() > GEMINI_CACHE_EXTEND_WITHIN_SECONDS:
+        return entry["name"]
+
+    with _key_lock(key):
+        entry = _entries.get(key)
+        if _is_live(entry) and entry["expires_at"] - time.time() <= GEMINI_CACHE_EXTEND_WITHIN_SECONDS:
+            _extend_locked(key, extend)
+        entry = _entries.get(key)
+        return entry["name"] if _is_live(entry) else None
+
+
+def recently_failed(key):
+    failed_at = _failures.get(key)
+    return failed_at is not None and time.time() - failed_at < GEMINI_CACHE_FAILURE_BACKOFF_SECONDS
+
+
+def adopt(key, cache_name, expires_at):
+    """Register a cache created before this process started (e.g. the name persisted with a chat)."""
+    with _key_lock(key):
+        if not _is_live(_entries.get(key)):
+            _entries[key] = {"name": cache_name, "expires_at": expires_at, "created_at": time.time(), "last_used": time.time()}
+        return _entries[key]["name"]
+
+
+def get_or_create(key, create, extend=None):
+    """
+    Name of the shared cache for key, calling create() -> (cache name, expires_at) at most once however many chats ask at the same time.
+    Returns None while a recent creation attempt for key is backing off; otherwise create()'s exceptions propagate.
+    """
+    cache_name = get_cached(key, extend)
+    if cache_name:
+        return cache_name
+
+    with _key_lock(key):
+        entry = _entries.get(key)
+        if _is_live(entry):
+            entry["last_used"] = time.time()
+            return entry["name"]
+        if recently_failed(key):
+            return None
+
+        try:
+            cache_name, expires_at = create()
+        except Exception:
+            _failures[key] = time.time()
+            raise
+        _failures.pop(key, None)
+        _entries[key] = {"name": cache_name, "expires_at": expires_at, "created_at": time.time(), "last_used": time.time()}
+        return cache_name
+
+
+def invalidate(key, cache_name):
+    """Drop key's entry if it still points at cache_name, so a newer cache built meanwhile is kept."""
+    with _key_lock(key):
+        entry = _entries.get(key)
+        if entry and entry["name"] == cache_name:
+            del _entries[key]
+
+
+def used_since(cache_name, since):
+    """Whether this process handed out cache_name at or after the time since."""
+    return any(entry["name"] == cache_name and entry["last_used"] >= since for entry in list(_entries.values()))
+
+
+def forget(cache_name):
+    """Drop every entry pointing at cache_name, e.g. after it was deleted."""
+    for key, entry in list(_entries.items()):
+        if entry["name"] == cache_name:
+            invalidate(key, cache_name)
+
+
+def reap(sweep=None):
+    """
+    Forget caches that have expired, then call sweep() to delete remote caches nothing refers to anymore. The pool
+    only sees this process, so deciding which caches are unreferenced across workers is left to sweep.
+    """
+    for key in list(_entries):
+        with _key_lock(key):
+            entry = _entries.get(key)
+            if entry is not None and not _is_live(entry):
+                del _entries[key]
+    for key, failed_at in list(_failures.items()):
+        if time.time() - failed_at >= GEMINI_CACHE_FAILURE_BACKOFF_SECONDS:
+            _failures.pop(key, None)
+    if sweep is not None:
+        sweep()
+
+
+def start_reaper(sweep=None):
+    """Start the background reaper once per process; later calls only replace its sweep."""
+    global _reaper, _sweep
+    with _locks_guard:
+        _sweep = sweep
+        if _reaper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(GEMINI_CACHE_REAPER_INTERVAL_SECONDS)
+                try:
+                    reap(_sweep)
+                except Exception as e:
+                    print(f"Warning: Gemini cache reaper failed: {e}")
+
+        _reaper = threading.Thread(target=run, name="gemini-cache-reaper", daemon=True)
+        _reaper.start()
@@ -0,0 +1,143 @@
+# app_modules/market_data.py
+import os
+import datetime
+import threading
+import pandas as pd
+import yfinance as yf
+from . import app_config
+
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+class YFinanceProvider:
+    name = "yfinance"
+
+    def fetch_history(self, symbols, start_date, end_date):
+        """
+        Daily OHLCV per symbol between start_date and end_date (inclusive). Prices are not dividend-adjusted, so they
+        stay valid once stored; Yahoo still adjusts them for splits, which fetch_splits lets the store detect.
+        Symbols the download did not return at all are left out of the result rather than reported as empty.
+        """
+        start = start_date.isoformat()
+        end = (end_date + datetime.timedelta(days=1)).isoformat()
+        if len(symbols) == 1:
+            return {symbols[0]: yf.Ticker(symbols[0]).history(
+                start=start, end=end, auto_adjust=False, timeout=app_config.MARKET_DATA_REQUEST_TIMEOUT_SECONDS
+            )}
+
+        bulk = yf.download(
+            list(symbols), start=start, end=end,
+            group_by="ticker", auto_adjust=False, progress=False,
+            timeout=app_config.MARKET_DATA_REQUEST_TIMEOUT_SECONDS,
+        )
+        histories = {}
+        for symbol in symbols:
+            if isinstance(bulk.columns, pd.MultiIndex):
+                if symbol not in bulk.columns.get_level_values(0):
+                    continue
+                hist = bulk[symbol]
+            else:
+                hist = bulk
+            histories[symbol] = hist.dropna(subset=["Close"])
+        return histories
+
+    def fetch_splits(self, symbol, since):
+        """ISO dates of the stock splits of symbol on or after the date since."""
+        # Ticker.splits takes no timeout and covers the whole history, so read the split column of a short window.
+        hist = yf.Ticker(symbol).history(
+            start=since.isoformat(), auto_adjust=False, actions=True, timeout=app_config.MARKET_DATA_REQUEST_TIMEOUT_SECONDS
+        )
+        if hist.empty or "Stock Splits" not in hist.columns:
+            return []
+        return [index.date().isoformat() for index in hist.index[hist["Stock Splits"] != 0]]
+
+    def has_listing(self, symbol):
+        """Whether Yahoo quotes symbol exactly as given, e.g. a bare US ticker."""
+        return not yf.Ticker(symbol).history(
+            period="5d", auto_adjust=False, timeout=app_config.MARKET_DATA_REQUEST_TIMEOUT_SECONDS
+        ).empty
+
+
+class FixtureProvider:
+    """Serves snapshots from <fixture_dir>/<SYMBOL>.csv (or .parquet) with Date,Open,High,Low,Close,Volume columns."""
+
+    name = "fixture"
+
+    def __init__(self, fixture_dir=None):
+        self.fixture_dir = fixture_dir or os.getenv("MARKET_DATA_FIXTURE_DIR", app_config.MARKET_DATA_FIXTURE_DIR)
+
+    def _base_path(self, symbol):
+        safe_symbol = "".join(c if c.isalnum() or c in ['.', '-'] else "_" for c in symbol.upper())
+        return os.path.join(self.fixture_dir, safe_symbol)
+
+    def _load(self, symbol):
+        base_path = self._base_path(symbol)
+        if os.path.exists(f"{base_path}.parquet"):
+            df = pd.read_parquet(f"{base_path}.parquet")
+        elif os.path.exists(f"{base_path}.csv"):
+            df = pd.read_csv(f"{base_path}.csv")
+        else:
+            return None
+        df["Date"] = pd.to_datetime(df["Date"])
+        return df.set_index("Date")[PRICE_COLUMNS].sort_index()
+
+    def fetch_history(self, symbols, start_date, end_date):
+        histories = {}
+        for symbol in symbols:
+            hist = self._load(symbol)
+            if hist is None:
+                continue
+            histories[symbol] = hist[(hist.index.date >= start_date) & (hist.index.date <= end_date)]
+        return histories
+
+    def fetch_splits(self, symbol, since):
+        # Snapshots never change after they are recorded.
+        return []
+
+    def has_listing(self, symbol):
+        base_path = self._base_path(symbol)
+        return os.path.exists(f"{base_path}.parquet") or os.path.exists(f"{base_path}.csv")
+
+    def save_snapshot(self, symbol, hist):
+        os.makedirs(self.fixture_dir, exist_ok=True)
+        snapshot = hist[PRICE_COLUMNS].copy()
+        snapshot.index = pd.DatetimeIndex(snapshot.index.date, name="Date")
+        snapshot.to_csv(f"{self._base_path(symbol)}.csv")
+
+
+def record_fixtures(symbols, start_date, end_date, fixture_dir=None):
+    """Captures live yfinance data as fixture snapshots for offline runs and benchmarks."""
+    fixture_provider = FixtureProvider(fixture_dir)
+    for symbol, hist in YFinanceProvider().fetch_history(list(symbols), start_date, end_date).items():
+        fixture_provider.save_snapshot(symbol, hist)
+
+
+PROVIDERS = {
+    YFinanceProvider.name: YFinanceProvider,
+    FixtureProvider.name: FixtureProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def register_provider(name, factory):
+    PROVIDERS[name] = factory
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                provider_name = os.getenv("MARKET_DATA_PROVIDER", app_config.MARKET_DATA_PROVIDER)
+                if provider_name not in PROVIDERS:
+                    raise ValueError(f"Unknown market data provider: {provider_name}")
+                _provider = PROVIDERS[provider_name]()
+    return _provider
+
+
+def set_provider(provider):
+    global _provider
+    with _provider_lock:
+        _provider = provider
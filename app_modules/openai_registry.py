@@ -0,0 +1,66 @@
+# app_modules/openai_registry.py
+import os
+import json
+import tempfile
+import threading
+from .app_config import OPENAI_REGISTRY_PATH
+
+ASSISTANTS = "assistants"
+VECTOR_STORES = "vector_stores"
+
+_state = None
+_lock = threading.Lock()
+
+
+def _load():
+    global _state
+    if _state is None:
+        _state = {}
+        if os.path.exists(OPENAI_REGISTRY_PATH):
+            try:
+                with open(OPENAI_REGISTRY_PATH, "r") as f:
+                    _state = json.load(f)
+            except Exception as e:
+                print(f"Warning: Could not read OpenAI registry {OPENAI_REGISTRY_PATH}: {e}")
+    return _state
+
+
+def _write(state):
+    registry_dir = os.path.dirname(OPENAI_REGISTRY_PATH) or "."
+    os.makedirs(registry_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=registry_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(temp_path, OPENAI_REGISTRY_PATH)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def get(section, key):
+    """Stored record for key in section (e.g. ASSISTANTS), or None."""
+    with _lock:
+        record = _load().get(section, {}).get(key)
+        return dict(record) if record else None
+
+
+def put(section, key, record):
+    with _lock:
+        state = _load()
+        state.setdefault(section, {})[key] = record
+        try:
+            _write(state)
+        except Exception as e:
+            print(f"Warning: Could not save OpenAI registry {OPENAI_REGISTRY_PATH}: {e}")
+
+
+def remove(section, key):
+    with _lock:
+        state = _load()
+        if state.get(section, {}).pop(key, None) is not None:
+            try:
+                _write(state)
+            except Exception as e:
+                print(f"Warning: Could not save OpenAI registry {OPENAI_REGISTRY_PATH}: {e}")
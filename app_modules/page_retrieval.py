@@ -0,0 +1,83 @@
+# app_modules/page_retrieval.py
+import re
+import math
+import threading
+from collections import Counter
+from . import pdf_extraction
+from .app_config import RETRIEVAL_TOP_K_PAGES
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[&.][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "did", "do", "does", "for", "from", "has", "have",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "the", "there", "this", "to", "was", "were",
+    "what", "which", "with", "you", "your",
+}
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class PageIndex:
+    """BM25 inverted index over the pages of one document."""
+
+    def __init__(self, pages):
+        self.pages = {page["page"]: page["text"] for page in pages}
+        self.postings = {}
+        self.page_lengths = {}
+        for page_number, text in self.pages.items():
+            term_counts = Counter(tokenize(text))
+            self.page_lengths[page_number] = sum(term_counts.values())
+            for term, count in term_counts.items():
+                self.postings.setdefault(term, {})[page_number] = count
+        self.average_length = (sum(self.page_lengths.values()) / len(self.page_lengths)) if self.page_lengths else 0
+
+    def score(self, query):
+        scores = Counter()
+        total_pages = len(self.pages)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total_pages - len(postings) + 0.5) / (len(postings) + 0.5))
+            for page_number, count in postings.items():
+                length_norm = 1 - BM25_B + BM25_B * self.page_lengths[page_number] / self.average_length
+                scores[page_number] += idf * count * (BM25_K1 + 1) / (count + BM25_K1 * length_norm)
+        return scores
+
+    def top_pages(self, query, top_k):
+        return [page_number for page_number, _ in self.score(query).most_common(top_k)]
+
+
+def get_page_index(pdf_path):
+    document = pdf_extraction.get_document(pdf_path)
+    sha256 = document["sha256"]
+    if sha256 not in _indexes:
+        with _index_lock:
+            if sha256 not in _indexes:
+                _indexes[sha256] = PageIndex(document["pages"])
+    return _indexes[sha256]
+
+
+def retrieve_pages(pdf_path, query, top_k=RETRIEVAL_TOP_K_PAGES):
+    """Page numbers most relevant to query, in document order. The first page (statement header and summary) is always kept."""
+    index = get_page_index(pdf_path)
+    selected = set(index.top_pages(query, top_k))
+    if index.pages:
+        selected.add(min(index.pages))
+    return sorted(selected)
+
+
+def build_page_context(pdf_path, query, top_k=RETRIEVAL_TOP_K_PAGES):
+    index = get_page_index(pdf_path)
+    page_numbers = retrieve_pages(pdf_path, query, top_k)
+    sections = [f"[Page {page_number}]\n{index.pages[page_number].strip()}" for page_number in page_numbers]
+    return (
+        f"Excerpts from the statement, {len(page_numbers)} of {len(index.pages)} pages selected for this question. "
+        "Each excerpt starts with its page number; use these numbers for citations.\n\n" + "\n\n".join(sections)
+    )
@@ -0,0 +1,121 @@
+# app_modules/pdf_extraction.py
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import pdfplumber
+from .app_config import PDF_EXTRACTION_CACHE_DIR
+
+# Bump when the extracted structure changes so stale cache entries are ignored.
+EXTRACTION_VERSION = 2
+
+_documents = {}
+_file_hashes = {}
+_document_locks = {}
+_locks_guard = threading.Lock()
+_prefetched_paths = set()
+
+
+def file_sha256(pdf_path):
+    stat = os.stat(pdf_path)
+    cache_key = (os.path.abspath(pdf_path), stat.st_mtime_ns, stat.st_size)
+    if cache_key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        _file_hashes[cache_key] = digest.hexdigest()
+    return _file_hashes[cache_key]
+
+
+def _cache_path(sha256):
+    return os.path.join(PDF_EXTRACTION_CACHE_DIR, f"{sha256}.v{EXTRACTION_VERSION}.json")
+
+
+def _document_lock(sha256):
+    with _locks_guard:
+        return _document_locks.setdefault(sha256, threading.Lock())
+
+
+def _extract(pdf_path, sha256):
+    pages = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_number, page in enumerate(pdf.pages, start=1):
+            tables = [
+                {
+                    "top": table.bbox[1],
+                    "rows": [[cell if cell is not None else "" for cell in row] for row in table.extract()],
+                }
+                for table in page.find_tables()
+            ]
+            lines = [{"top": line["top"], "text": line["text"]} for line in page.extract_text_lines()]
+            pages.append({
+                "page": page_number,
+                "text": page.extract_text() or "",
+                "lines": lines,
+                "tables": tables,
+            })
+    return {"sha256": sha256, "source_name": os.path.basename(pdf_path), "pages": pages}
+
+
+def _write_cache(sha256, document):
+    os.makedirs(PDF_EXTRACTION_CACHE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=PDF_EXTRACTION_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(document, f)
+        os.replace(temp_path, _cache_path(sha256))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def get_document(pdf_path):
+    """Per-page text and tables for pdf_path, parsed once per distinct file content."""
+    sha256 = file_sha256(pdf_path)
+    if sha256 in _documents:
+        return _documents[sha256]
+
+    with _document_lock(sha256):
+        if sha256 in _documents:
+            return _documents[sha256]
+        document = None
+        cache_path = _cache_path(sha256)
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r") as f:
+                    document = json.load(f)
+            except Exception as e:
+                print(f"Warning: Error loading extraction cache {cache_path}: {e}")
+        if document is None:
+            document = _extract(pdf_path, sha256)
+            try:
+                _write_cache(sha256, document)
+            except Exception as e:
+                print(f"Error saving extraction cache {cache_path}: {e}")
+        _documents[sha256] = document
+        return document
+
+
+def get_page_texts(pdf_path):
+    return {page["page"]: page["text"] for page in get_document(pdf_path)["pages"]}
+
+
+def prefetch_documents(pdf_paths):
+    """Parses documents on a background thread so the first question does not pay for extraction."""
+    with _locks_guard:
+        pending = [p for p in pdf_paths if p and p not in _prefetched_paths and os.path.exists(p)]
+        _prefetched_paths.update(pending)
+    if not pending:
+        return
+
+    def _run():
+        for pdf_path in pending:
+            try:
+                get_document(pdf_path)
+            except Exception as e:
+                print(f"Warning: Error extracting {pdf_path}: {e}")
+
+    threading.Thread(target=_run, name="pdf-extraction-prefetch", daemon=True).start()
@@ -0,0 +1,57 @@
+# app_modules/price_analytics.py
+import numpy as np
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def summarize_closes(closes):
+    """Return, CAGR, annualized volatility and max drawdown for a date-indexed Series of closing prices."""
+    values = closes.to_numpy(dtype=float)
+    dates = closes.index
+    daily_returns = values[1:] / values[:-1] - 1
+
+    period_return = values[-1] / values[0] - 1
+    years = (dates[-1] - dates[0]).days / 365.25
+    cagr = (values[-1] / values[0]) ** (1 / years) - 1 if years > 0 else None
+    volatility = (
+        float(np.std(daily_returns, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR))
+        if len(daily_returns) > 1 else None
+    )
+
+    running_peak = np.maximum.accumulate(values)
+    drawdowns = values / running_peak - 1
+    trough_position = int(np.argmin(drawdowns))
+    peak_position = int(np.argmax(values[:trough_position + 1]))
+
+    return {
+        "start_date": dates[0].strftime("%Y-%m-%d"),
+        "end_date": dates[-1].strftime("%Y-%m-%d"),
+        "start_close": round(float(values[0]), 2),
+        "end_close": round(float(values[-1]), 2),
+        "trading_days": int(len(values)),
+        "period_return_pct": round(float(period_return) * 100, 2),
+        "cagr_pct": round(float(cagr) * 100, 2) if cagr is not None else None,
+        "annualized_volatility_pct": round(volatility * 100, 2) if volatility is not None else None,
+        "max_drawdown_pct": round(float(drawdowns[trough_position]) * 100, 2),
+        "max_drawdown_peak_date": dates[peak_position].strftime("%Y-%m-%d"),
+        "max_drawdown_trough_date": dates[trough_position].strftime("%Y-%m-%d"),
+    }
+
+
+def compare_to_benchmark(closes, benchmark_closes):
+    """Relative performance on the sessions both series traded."""
+    aligned = closes.to_frame("asset").join(benchmark_closes.to_frame("benchmark"), how="inner").dropna()
+    if len(aligned) < 2:
+        return None
+    returns = aligned.pct_change().dropna().to_numpy()
+    asset_return = aligned["asset"].iloc[-1] / aligned["asset"].iloc[0] - 1
+    benchmark_return = aligned["benchmark"].iloc[-1] / aligned["benchmark"].iloc[0] - 1
+
+    beta = None
+    if len(returns) > 1 and np.var(returns[:, 1], ddof=1) > 0:
+        beta = float(np.cov(returns[:, 0], returns[:, 1], ddof=1)[0, 1] / np.var(returns[:, 1], ddof=1))
+    return {
+        "benchmark_return_pct": round(float(benchmark_return) * 100, 2),
+        "excess_return_pct": round(float(asset_return - benchmark_return) * 100, 2),
+        "beta": round(beta, 3) if beta is not None else None,
+    }
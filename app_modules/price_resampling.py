@@ -0,0 +1,75 @@
+# app_modules/price_resampling.py
+import numpy as np
+import pandas as pd
+
+RESAMPLE_DAILY = "daily"
+RESAMPLE_WEEKLY = "weekly"
+RESAMPLE_MONTHLY = "monthly"
+RESAMPLE_LTTB = "lttb"
+MIN_LTTB_POINTS = 3  # The first and last samples plus at least one bucket
+
+RESAMPLE_RULES = {
+    RESAMPLE_WEEKLY: "W-FRI",
+    RESAMPLE_MONTHLY: "ME",
+}
+
+
+def resample_ohlc(hist, resolution):
+    """Aggregates daily OHLC rows into weekly or monthly bars dated on each period's last session."""
+    bars = hist.assign(SessionDate=hist.index).groupby(pd.Grouper(freq=RESAMPLE_RULES[resolution])).agg(
+        Date=("SessionDate", "last"),
+        Open=("Open", "first"),
+        High=("High", "max"),
+        Low=("Low", "min"),
+        Close=("Close", "last"),
+    )
+    return bars.dropna(subset=["Close"]).set_index("Date")
+
+
+def lttb_indices(values, target_points):
+    """Largest-triangle-three-buckets: positions of the target_points samples that best keep the line's shape."""
+    total = len(values)
+    if target_points >= total or target_points < MIN_LTTB_POINTS:
+        return np.arange(total)
+
+    x = np.arange(total, dtype=float)
+    y = np.asarray(values, dtype=float)
+    # target_points - 2 buckets between the fixed first and last samples.
+    edges = np.linspace(1, total - 1, target_points - 1).astype(int)
+    selected = np.empty(target_points, dtype=int)
+    selected[0], selected[-1] = 0, total - 1
+
+    anchor = 0
+    for bucket in range(target_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else total
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[anchor] - next_x) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (next_y - y[anchor])
+        )
+        anchor = start + int(np.argmax(areas))
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def downsample(hist, resolution=None, max_points=None):
+    """Returns (rows, resolution_used). With no explicit resolution, the finest one that fits max_points is used."""
+    if resolution in RESAMPLE_RULES:
+        hist = resample_ohlc(hist, resolution)
+    elif resolution is None and max_points:
+        daily, resolution = hist, RESAMPLE_DAILY
+        for candidate in (RESAMPLE_WEEKLY, RESAMPLE_MONTHLY):
+            if len(hist) <= max_points:
+                break
+            hist, resolution = resample_ohlc(daily, candidate), candidate
+    else:
+        resolution = RESAMPLE_DAILY
+
+    if max_points and len(hist) > max_points:
+        selected = lttb_indices(hist["Close"].to_numpy(), max_points)
+        if len(selected) < len(hist):
+            hist = hist.iloc[selected]
+            resolution = f"{resolution}+{RESAMPLE_LTTB}"
+    return hist, resolution
@@ -0,0 +1,248 @@
+# app_modules/price_store.py
+import os
+import sqlite3
+import threading
+import time
+import datetime
+from contextlib import ExitStack, closing
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from . import market_data, trading_calendar
+from .app_config import (
+    PRICE_STORE_DIR, PRICE_STORE_INTRADAY_TTL_SECONDS, PRICE_STORE_SETTLEMENT_SECONDS, PRICE_STORE_SPLIT_CHECK_SECONDS,
+    PRICE_STORE_SPLIT_RETRY_SECONDS, PRICE_STORE_SPLIT_LOOKBACK_DAYS,
+)
+from .market_data import PRICE_COLUMNS
+
+# Version 2 stores prices that are not dividend-adjusted and only trusts coverage written after a session closed;
+# stores written by older versions are discarded.
+SCHEMA_VERSION = 2
+
+_symbol_locks = {}
+_symbol_locks_guard = threading.Lock()
+_split_checker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="price-split-check")
+_pending_split_checks = set()
+
+
+def _get_symbol_lock(symbol):
+    with _symbol_locks_guard:
+        return _symbol_locks.setdefault(symbol.upper(), threading.Lock())
+
+
+def get_store_dir():
+    # Each provider gets its own partition set so fixture runs never mix with live data.
+    return os.path.join(PRICE_STORE_DIR, market_data.get_provider().name)
+
+
+def get_symbol_store_path(symbol):
+    safe_symbol = "".join(c if c.isalnum() or c in ['.', '-'] else "_" for c in symbol.upper())
+    return os.path.join(get_store_dir(), f"{safe_symbol}.sqlite")
+
+
+def _connect(symbol):
+    os.makedirs(get_store_dir(), exist_ok=True)
+    conn = sqlite3.connect(get_symbol_store_path(symbol), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        conn.execute("DROP TABLE IF EXISTS prices")
+        conn.execute("DROP TABLE IF EXISTS coverage")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS prices ("
+        "date TEXT PRIMARY KEY, open REAL, high REAL, low REAL, close REAL, volume REAL)"
+    )
+    # One row per calendar day already fetched, so weekends and holidays are not re-requested.
+    conn.execute("CREATE TABLE IF NOT EXISTS coverage (date TEXT PRIMARY KEY, fetched_at REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def _read_meta(conn):
+    return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+
+def _write_meta(conn, values):
+    conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [(key, str(value)) for key, value in values.items()])
+    conn.commit()
+
+
+def _schedule_split_check(conn, symbol):
+    """Queue a background split check of symbol if one is due; reads never wait for it."""
+    meta = _read_meta(conn)
+    now = time.time()
+    if (now - float(meta.get("splits_checked_at", 0)) < PRICE_STORE_SPLIT_CHECK_SECONDS
+            or now - float(meta.get("splits_attempted_at", 0)) < PRICE_STORE_SPLIT_RETRY_SECONDS):
+        return
+    with _symbol_locks_guard:
+        if symbol.upper() in _pending_split_checks:
+            return
+        _pending_split_checks.add(symbol.upper())
+    _split_checker.submit(_check_splits, symbol)
+
+
+def _check_splits(symbol):
+    """
+    Discard the stored rows if the provider reports a split newer than the last one seen: its prices are
+    split-adjusted, so rows fetched before the split are on a different basis from anything fetched after it.
+    Only the days since the previous check are asked for, and the network call is made without the symbol lock.
+    """
+    try:
+        with closing(_connect(symbol)) as conn:
+            meta = _read_meta(conn)
+            first_fetched_at = conn.execute("SELECT MIN(fetched_at) FROM coverage").fetchone()[0]
+        checked_at = float(meta.get("splits_checked_at", 0)) or first_fetched_at or time.time()
+        since = datetime.date.fromtimestamp(checked_at) - datetime.timedelta(days=PRICE_STORE_SPLIT_LOOKBACK_DAYS)
+        try:
+            last_split = max(market_data.get_provider().fetch_splits(symbol, since), default="")
+        except Exception as e:
+            print(f"Warning: Could not check {symbol} for stock splits: {e}")
+            with _get_symbol_lock(symbol), closing(_connect(symbol)) as conn:
+                _write_meta(conn, {"splits_attempted_at": time.time()})
+            return
+
+        with _get_symbol_lock(symbol), closing(_connect(symbol)) as conn:
+            meta = _read_meta(conn)
+            # Before the first check, rows fetched since the day before the first fetch may predate a split.
+            baseline = meta.get("last_split") or (
+                (datetime.date.fromtimestamp(first_fetched_at) - datetime.timedelta(days=1)).isoformat()
+                if first_fetched_at else ""
+            )
+            if last_split > baseline:
+                print(f"Warning: {symbol} split on {last_split}; discarding its stored prices.")
+                conn.execute("DELETE FROM prices")
+                conn.execute("DELETE FROM coverage")
+            _write_meta(conn, {
+                "last_split": max(last_split, meta.get("last_split", "")),
+                "splits_checked_at": time.time(), "splits_attempted_at": time.time(),
+            })
+    except Exception as e:
+        print(f"Warning: Stock split check of {symbol} failed: {e}")
+    finally:
+        with _symbol_locks_guard:
+            _pending_split_checks.discard(symbol.upper())
+
+
+def _needs_refetch(symbol, day, fetched_at, now):
+    """A covered day is final once fetched after its session settled; before that it is refreshed like live data."""
+    if not trading_calendar.is_session_for_symbol(symbol, day):
+        return False
+    final_at = trading_calendar.session_close_timestamp(symbol, day) + PRICE_STORE_SETTLEMENT_SECONDS
+    if fetched_at >= final_at:
+        return False
+    return now >= final_at or now - fetched_at > PRICE_STORE_INTRADAY_TTL_SECONDS
+
+
+def _missing_days(conn, symbol, start_date, end_date, today):
+    covered = dict(conn.execute(
+        "SELECT date, fetched_at FROM coverage WHERE date BETWEEN ? AND ?",
+        (start_date.isoformat(), end_date.isoformat()),
+    ).fetchall())
+    now = time.time()
+    missing = []
+    day = start_date
+    while day <= min(end_date, today):
+        fetched_at = covered.get(day.isoformat())
+        if fetched_at is None or _needs_refetch(symbol, day, fetched_at, now):
+            missing.append(day)
+        day += datetime.timedelta(days=1)
+    return missing
+
+
+def _contiguous_runs(days):
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + datetime.timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def _store_history(conn, symbol, run_start, run_end, hist):
+    rows = [
+        (
+            index.date().isoformat(),
+            float(row["Open"]), float(row["High"]), float(row["Low"]),
+            float(row["Close"]), float(row["Volume"]),
+        )
+        for index, row in hist.iterrows()
+        if run_start <= index.date() <= run_end
+    ]
+    fetched_at = time.time()
+    run_days = [run_start + datetime.timedelta(days=offset) for offset in range((run_end - run_start).days + 1)]
+    if hist.empty:
+        # A failed or rate-limited fetch also comes back empty, so only days without a session count as covered.
+        run_days = [day for day in run_days if not trading_calendar.is_session_for_symbol(symbol, day)]
+    covered_days = [(day.isoformat(), fetched_at) for day in run_days]
+    conn.executemany("INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.executemany("INSERT OR REPLACE INTO coverage VALUES (?, ?)", covered_days)
+    conn.commit()
+
+
+def _fetch_and_store(conn, symbol, run_start, run_end):
+    hist = market_data.get_provider().fetch_history([symbol], run_start, run_end).get(symbol)
+    if hist is not None:  # Symbols the provider could not fetch keep their days uncovered
+        _store_history(conn, symbol, run_start, run_end, hist)
+
+
+def _read_history(conn, start_date, end_date):
+    df = pd.read_sql_query(
+        "SELECT date, open, high, low, close, volume FROM prices "
+        "WHERE date BETWEEN ? AND ? ORDER BY date",
+        conn,
+        params=(start_date.isoformat(), end_date.isoformat()),
+    )
+    df.columns = ["Date"] + PRICE_COLUMNS
+    df["Date"] = pd.to_datetime(df["Date"])
+    return df.set_index("Date")
+
+
+def get_price_history(symbol, start_date, end_date):
+    """Returns daily OHLCV rows for symbol between start_date and end_date (inclusive).
+
+    Only calendar days not already in the local store are fetched from the network.
+    Days fetched after their session settled are kept until a background check finds a stock split;
+    days fetched earlier are refetched after PRICE_STORE_INTRADAY_TTL_SECONDS, and as soon
+    as their session has settled.
+    """
+    today = datetime.date.today()
+    with _get_symbol_lock(symbol):
+        conn = _connect(symbol)
+        try:
+            _schedule_split_check(conn, symbol)
+            for run_start, run_end in _contiguous_runs(_missing_days(conn, symbol, start_date, end_date, today)):
+                _fetch_and_store(conn, symbol, run_start, run_end)
+            return _read_history(conn, start_date, end_date)
+        finally:
+            conn.close()
+
+
+def get_price_history_batch(symbols, start_date, end_date, days=None):
+    """
+    Same as get_price_history for several symbols. With days, only those dates within the range are filled in.
+    Each symbol's missing days are grouped into runs, and symbols missing the same run share one bulk download.
+    """
+    today = datetime.date.today()
+    symbols = list(dict.fromkeys(symbols))
+    wanted_days = set(days) if days is not None else None
+    with ExitStack() as stack:
+        # Taken in a fixed order so batches over overlapping symbols cannot deadlock.
+        for symbol_key in sorted({symbol.upper() for symbol in symbols}):
+            stack.enter_context(_get_symbol_lock(symbol_key))
+        conns = {symbol: stack.enter_context(closing(_connect(symbol))) for symbol in symbols}
+
+        symbols_by_run = {}
+        for symbol, conn in conns.items():
+            _schedule_split_check(conn, symbol)
+            missing = _missing_days(conn, symbol, start_date, end_date, today)
+            if wanted_days is not None:
+                missing = [day for day in missing if day in wanted_days]
+            for run_start, run_end in _contiguous_runs(missing):
+                symbols_by_run.setdefault((run_start, run_end), []).append(symbol)
+
+        for (run_start, run_end), run_symbols in symbols_by_run.items():
+            bulk = market_data.get_provider().fetch_history(run_symbols, run_start, run_end)
+            for symbol, hist in bulk.items():
+                _store_history(conns[symbol], symbol, run_start, run_end, hist)
+
+        return {symbol: _read_history(conn, start_date, end_date) for symbol, conn in conns.items()}
@@ -0,0 +1,129 @@
+# app_modules/provider_clients.py
+import time
+import asyncio
+import threading
+import httpx
+import openai
+from google import genai
+from google.genai import types
+from . import provider_loop
+from .app_config import (
+    PROVIDER_HTTP_MAX_CONNECTIONS, PROVIDER_HTTP_MAX_KEEPALIVE, PROVIDER_HTTP_CONNECT_TIMEOUT_SECONDS,
+    PROVIDER_HTTP_READ_TIMEOUT_SECONDS, PROVIDER_MAX_RETRIES, PROVIDER_CLIENT_MAX_AGE_SECONDS,
+    PROVIDER_CLIENT_FAILURE_THRESHOLD,
+)
+
+GEMINI = "gemini"
+OPENAI = "openai"
+OPENAI_ASYNC = "openai_async"
+
+_clients = {}
+_lock = threading.Lock()
+
+_CONNECTION_ERRORS = (httpx.TransportError, openai.APIConnectionError, ConnectionError)
+
+
+def _limits():
+    return httpx.Limits(max_connections=PROVIDER_HTTP_MAX_CONNECTIONS, max_keepalive_connections=PROVIDER_HTTP_MAX_KEEPALIVE)
+
+
+def _timeout():
+    return httpx.Timeout(PROVIDER_HTTP_READ_TIMEOUT_SECONDS, connect=PROVIDER_HTTP_CONNECT_TIMEOUT_SECONDS)
+
+
+def _build(provider, api_key):
+    if provider == GEMINI:
+        # The async side (client.aio) keeps its own SDK-managed session for the life of the client.
+        return genai.Client(api_key=api_key, http_options=types.HttpOptions(
+            timeout=int(PROVIDER_HTTP_READ_TIMEOUT_SECONDS * 1000),
+            client_args={"limits": _limits()},
+        ))
+    if provider == OPENAI:
+        return openai.OpenAI(
+            api_key=api_key, max_retries=PROVIDER_MAX_RETRIES,
+            http_client=openai.DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+        )
+    if provider == OPENAI_ASYNC:
+        # Only ever used from the provider_loop event loop, which its connection pool is bound to.
+        return openai.AsyncOpenAI(
+            api_key=api_key, max_retries=PROVIDER_MAX_RETRIES,
+            http_client=openai.DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()),
+        )
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+def _close_later(provider, client):
+    """
+    Close a replaced client's connection pools on the provider loop, once any request that was still using it has
+    had its full read timeout to finish.
+    """
+    async def close():
+        await asyncio.sleep(PROVIDER_HTTP_READ_TIMEOUT_SECONDS)
+        try:
+            if provider == GEMINI:
+                client.close()
+                await client.aio.aclose()
+            elif provider == OPENAI:
+                client.close()
+            else:
+                await client.close()
+        except Exception as e:
+            print(f"Warning: Could not close replaced {provider} client: {e}")
+
+    provider_loop.submit(close())
+
+
+def get_client(provider, api_key):
+    """
+    Long-lived client for (provider, api_key), shared by every session so connections and TLS sessions are reused.
+    A client is rebuilt once it is older than PROVIDER_CLIENT_MAX_AGE_SECONDS or after repeated connection failures.
+    """
+    key = (provider, api_key)
+    with _lock:
+        entry = _clients.get(key)
+        if entry is None or time.time() - entry["created_at"] > PROVIDER_CLIENT_MAX_AGE_SECONDS:
+            if entry is not None:
+                _close_later(provider, entry["client"])
+            entry = {"client": _build(provider, api_key), "created_at": time.time(), "failures": 0}
+            _clients[key] = entry
+        return entry["client"]
+
+
+def get_gemini_client(api_key):
+    return get_client(GEMINI, api_key)
+
+
+def get_openai_client(api_key):
+    return get_client(OPENAI, api_key)
+
+
+def get_async_openai_client(api_key):
+    return get_client(OPENAI_ASYNC, api_key)
+
+
+def _key_for(client):
+    for key, entry in _clients.items():
+        if entry["client"] is client:
+            return key
+    return None
+
+
+def report_success(client):
+    with _lock:
+        key = _key_for(client)
+        if key:
+            _clients[key]["failures"] = 0
+
+
+def report_failure(client, error):
+    """Count connection-level failures; after PROVIDER_CLIENT_FAILURE_THRESHOLD in a row the client is replaced."""
+    if not isinstance(error, _CONNECTION_ERRORS):
+        return
+    with _lock:
+        key = _key_for(client)
+        if key is None:
+            return
+        _clients[key]["failures"] += 1
+        if _clients[key]["failures"] >= PROVIDER_CLIENT_FAILURE_THRESHOLD:
+            print(f"Warning: Reconnecting {key[0]} client after {_clients[key]['failures']} connection failures: {error}")
+            _close_later(key[0], _clients.pop(key)["client"])
@@ -0,0 +1,44 @@
+# app_modules/provider_loop.py
+import queue
+import asyncio
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+_DONE = object()
+
+
+def get_loop():
+    """The process-wide event loop every provider coroutine runs on, started on first use in a daemon thread."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="provider-event-loop", daemon=True).start()
+        return _loop
+
+
+def submit(coro):
+    """Schedule coro on the shared loop; returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout=None):
+    """Run coro on the shared loop and wait for its result from a synchronous caller (e.g. the Streamlit script)."""
+    return submit(coro).result(timeout)
+
+
+def run_with_updates(make_coro, on_update):
+    """
+    Run make_coro(emit) on the shared loop. Every emit(item) made by the coroutine is delivered to on_update(item)
+    in the calling thread, so UI updates stay on the script thread. Returns the coroutine's result.
+    """
+    updates = queue.Queue()
+    future = submit(make_coro(updates.put))
+    future.add_done_callback(lambda _: updates.put(_DONE))
+    while True:
+        item = updates.get()
+        if item is _DONE:
+            break
+        on_update(item)
+    return future.result()
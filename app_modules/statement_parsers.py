@@ -0,0 +1,298 @@
+# app_modules/statement_parsers.py
+import re
+import threading
+import pandas as pd
+from . import pdf_extraction
+
+FORMAT_MONARCH = "monarch"
+FORMAT_KUNVARJI = "kunvarji"
+FORMAT_NIRMAL_BANG = "nirmal_bang"
+FORMAT_CDSL_CAS = "cdsl_cas"
+
+# Matched against the upper-cased text of the first page.
+FORMAT_MARKERS = [
+    (FORMAT_MONARCH, "MONARCH NETWORTH"),
+    (FORMAT_KUNVARJI, "KUNVARJI"),
+    (FORMAT_NIRMAL_BANG, "NIRMAL BANG"),
+    (FORMAT_CDSL_CAS, "CONSOLIDATED ACCOUNT STATEMENT (CAS)"),
+]
+
+PNL_SEGMENTS = ["Cash", "FNO", "Currency", "Commodity", "Total"]
+PNL_SECTION_PATTERN = re.compile(
+    r"(Cash Segment .*Transactions.*|F&O Gains|F&O Open Position|Currency Gains|Currency Open Position"
+    r"|Commodity Gains|Commodity Open Position|Notional Holding|Liabilities)$"
+)
+PNL_PERIOD_PATTERN = re.compile(r"for the period\s*:\s*(\S+)\s+to\s+(\S+)", re.IGNORECASE)
+# A section heading can sit on the same baseline as the first header row of its table.
+HEADING_TOLERANCE = 12
+
+NUMERIC_COLUMNS = {
+    "Qty", "Buy Qty", "Buy Rate", "Buy Total", "Sell Qty", "Sell Rate", "Sell Total", "Holding Period",
+    "Realized Gain", "CL Price", "Notional Gain", "Net Qty", "Avg Buy Rate", "Avg Sell Rate",
+}
+DATE_COLUMNS = {"Buy Date", "Sell Date"}
+
+_statements = {}
+_statements_lock = threading.Lock()
+
+
+def parse_amount(value):
+    """'1,83,569.05' -> 183569.05; blank cells and '--' -> None."""
+    if value is None:
+        return None
+    text = str(value).replace(",", "").replace("₹", "").strip()
+    if text in ("", "-", "--"):
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _clean_cell(value):
+    text = str(value or "").replace("\xad\n", "").replace("\xad", "")
+    return " ".join(text.split())
+
+
+def _clean_header(value):
+    return _clean_cell(str(value or "").replace("(`)", ""))
+
+
+def detect_format(document):
+    first_page = document["pages"][0]["text"].upper() if document["pages"] else ""
+    for statement_format, marker in FORMAT_MARKERS:
+        if marker in first_page:
+            return statement_format
+    return None
+
+
+def _table_rows(rows, header, page):
+    """Data rows as dicts keyed by the cleaned header, with numeric and date columns converted."""
+    records = []
+    for row in rows:
+        record = {"page": page}
+        for name, cell in zip(header, row):
+            if name in NUMERIC_COLUMNS:
+                record[name] = parse_amount(cell)
+            else:
+                record[name] = _clean_cell(cell)
+        records.append(record)
+    return records
+
+
+def _to_frame(records, columns=None):
+    df = pd.DataFrame(records, columns=columns)
+    for name in DATE_COLUMNS & set(df.columns):
+        df[name] = pd.to_datetime(df[name], dayfirst=True, errors="coerce")
+    return df
+
+
+def _parse_pnl_statement(document):
+    """Monarch and Kunvarji share the same 'Detailed Profit and Loss Statement' layout."""
+    summary, expenses, trades, holdings, open_positions, liabilities = [], [], [], [], [], []
+    period = None
+    section = None
+
+    for page in document["pages"]:
+        if period is None:
+            match = PNL_PERIOD_PATTERN.search(page["text"])
+            if match:
+                period = {"from": match.group(1), "to": match.group(2), "page": page["page"]}
+
+        headings = [line for line in page.get("lines", []) if PNL_SECTION_PATTERN.search(line["text"])]
+        for table in sorted(page["tables"], key=lambda t: t["top"]):
+            for heading in headings:
+                if heading["top"] <= table["top"] + HEADING_TOLERANCE:
+                    section = PNL_SECTION_PATTERN.search(heading["text"]).group(1)
+            headings = [h for h in headings if h["top"] > table["top"] + HEADING_TOLERANCE]
+
+            rows = table["rows"]
+            if not rows:
+                continue
+            header = [_clean_header(cell) for cell in rows[0]]
+            body = [row for row in rows[1:] if _clean_cell(row[0]) and not _clean_cell(row[0]).startswith("Total Buy Value")]
+
+            if header[0] in ("Gain/Loss", "Expense"):
+                target = summary if header[0] == "Gain/Loss" else expenses
+                for row in body:
+                    record = {"item": _clean_cell(row[0]), "page": page["page"]}
+                    for segment, cell in zip(PNL_SEGMENTS, row[1:]):
+                        record[segment] = parse_amount(cell)
+                    target.append(record)
+            elif header[0] != "Stock Name":
+                continue
+            elif "Realized Gain" in header:
+                for record in _table_rows(body, header, page["page"]):
+                    record["section"] = section
+                    trades.append(record)
+            elif "Net Qty" in header:
+                for record in _table_rows(body, header, page["page"]):
+                    record["section"] = section
+                    open_positions.append(record)
+            elif "Notional Gain" in header:
+                holdings.extend(_table_rows(body, header, page["page"]))
+            elif "Sell Total" in header:
+                liabilities.extend(_table_rows(body, header, page["page"]))
+
+        for heading in headings:
+            section = PNL_SECTION_PATTERN.search(heading["text"]).group(1)
+
+    return {
+        "period": period,
+        "summary": _to_frame(summary, ["item"] + PNL_SEGMENTS + ["page"]),
+        "expenses": _to_frame(expenses, ["item"] + PNL_SEGMENTS + ["page"]),
+        "trades": _to_frame(trades),
+        "holdings": _to_frame(holdings),
+        "open_positions": _to_frame(open_positions),
+        "liabilities": _to_frame(liabilities),
+    }
+
+
+def _parse_nirmal_bang(document):
+    holdings, holding_totals, capital_gains = [], [], []
+    category = None
+
+    for page in document["pages"]:
+        for table in page["tables"]:
+            rows = table["rows"]
+            if not rows:
+                continue
+            header = [_clean_cell(cell) for cell in rows[0]]
+            if header[:2] == ["ISIN Code", "Scrip Name"]:
+                for row in rows[1:]:
+                    cells = [_clean_cell(cell) for cell in row] + [""] * (5 - len(row))
+                    if cells[0] and not any(cells[1:]):
+                        category = cells[0]
+                    elif cells[0] in ("Total", "Grand Total"):
+                        holding_totals.append({
+                            "category": category if cells[0] == "Total" else "Grand Total",
+                            "quantity": parse_amount(cells[2]),
+                            "value": parse_amount(cells[4]),
+                            "page": page["page"],
+                        })
+                    elif cells[0]:
+                        holdings.append({
+                            "category": category,
+                            "isin": cells[0],
+                            "name": cells[1],
+                            "quantity": parse_amount(cells[2]),
+                            "rate": parse_amount(cells[3]),
+                            "value": parse_amount(cells[4]),
+                            "page": page["page"],
+                        })
+            elif header[0] == "Capital Gain Type":
+                for row in rows[1:]:
+                    cells = [_clean_cell(cell) for cell in row]
+                    if cells[0]:
+                        capital_gains.append({
+                            "type": cells[0],
+                            "buy_value": parse_amount(cells[1]),
+                            "sell_value": parse_amount(cells[2]),
+                            "realized_gain": parse_amount(cells[3]),
+                            "taxable_gain": parse_amount(cells[4]),
+                            "page": page["page"],
+                        })
+
+    return {
+        "holdings": pd.DataFrame(holdings, columns=["category", "isin", "name", "quantity", "rate", "value", "page"]),
+        "holding_totals": pd.DataFrame(holding_totals, columns=["category", "quantity", "value", "page"]),
+        "capital_gains": pd.DataFrame(
+            capital_gains, columns=["type", "buy_value", "sell_value", "realized_gain", "taxable_gain", "page"]
+        ),
+    }
+
+
+def _column_index(header, prefix):
+    for position, name in enumerate(header):
+        if name.startswith(prefix):
+            return position
+    return None
+
+
+def _parse_cdsl_cas(document):
+    """Headers are bilingual and the Hindi half extracts garbled, so columns are matched on their English prefix."""
+    asset_allocation, portfolio_history, holdings, mutual_funds = [], [], [], []
+
+    for page in document["pages"]:
+        for table in page["tables"]:
+            rows = table["rows"]
+            if not rows:
+                continue
+            header = [_clean_cell(cell) for cell in rows[0]]
+            if header[0].startswith("Asset Class"):
+                for row in rows[1:]:
+                    asset_allocation.append({
+                        "asset_class": _clean_cell(row[0]),
+                        "value": parse_amount(row[1]),
+                        "percentage": parse_amount(row[2]),
+                        "page": page["page"],
+                    })
+            elif header[0].startswith("Month-Year"):
+                for row in rows[1:]:
+                    portfolio_history.append({
+                        "month": _clean_cell(row[0]),
+                        "value": parse_amount(row[1]),
+                        "change": parse_amount(row[2]),
+                        "change_pct": parse_amount(row[3]),
+                        "page": page["page"],
+                    })
+            elif header[0].startswith("ISIN") and len(header) > 1 and header[1].startswith("Security"):
+                for row in rows[1:]:
+                    isin = _clean_cell(row[0])
+                    if not re.fullmatch(r"IN[A-Z0-9]{10}", isin):
+                        continue
+                    holdings.append({
+                        "isin": isin,
+                        "security": _clean_cell(row[1]),
+                        "quantity": parse_amount(row[2]),
+                        "market_price": parse_amount(row[-2]),
+                        "value": parse_amount(row[-1]),
+                        "page": page["page"],
+                    })
+            elif header[0] == "Scheme Name" and "ISIN" in header:
+                invested_col = _column_index(header, "Cumulative")
+                value_col = _column_index(header, "Valuation")
+                for row in rows[1:]:
+                    scheme = _clean_cell(row[0])
+                    if not scheme or scheme == "Grand Total":
+                        continue
+                    mutual_funds.append({
+                        "scheme": scheme,
+                        "isin": _clean_cell(row[1]),
+                        "folio": _clean_cell(row[2]),
+                        "invested": parse_amount(row[invested_col]) if invested_col is not None else None,
+                        "value": parse_amount(row[value_col]) if value_col is not None else None,
+                        "page": page["page"],
+                    })
+
+    return {
+        "asset_allocation": pd.DataFrame(asset_allocation, columns=["asset_class", "value", "percentage", "page"]),
+        "portfolio_history": pd.DataFrame(portfolio_history, columns=["month", "value", "change", "change_pct", "page"]),
+        "holdings": pd.DataFrame(holdings, columns=["isin", "security", "quantity", "market_price", "value", "page"]),
+        "mutual_funds": pd.DataFrame(mutual_funds, columns=["scheme", "isin", "folio", "invested", "value", "page"]),
+    }
+
+
+PARSERS = {
+    FORMAT_MONARCH: _parse_pnl_statement,
+    FORMAT_KUNVARJI: _parse_pnl_statement,
+    FORMAT_NIRMAL_BANG: _parse_nirmal_bang,
+    FORMAT_CDSL_CAS: _parse_cdsl_cas,
+}
+
+
+def parse_statement(pdf_path):
+    """Sections of a supported broker statement as DataFrames with a 'page' column, or None for unknown layouts."""
+    document = pdf_extraction.get_document(pdf_path)
+    sha256 = document["sha256"]
+    if sha256 in _statements:
+        return _statements[sha256]
+
+    statement_format = detect_format(document)
+    statement = None
+    if statement_format:
+        statement = PARSERS[statement_format](document)
+        statement["format"] = statement_format
+    with _statements_lock:
+        _statements[sha256] = statement
+    return statement
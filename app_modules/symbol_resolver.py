@@ -0,0 +1,195 @@
+# app_modules/symbol_resolver.py
+import bisect
+import csv
+import re
+import threading
+from . import market_data
+from .app_config import SYMBOL_MASTER_PATH, SYMBOL_MATCH_THRESHOLD, SYMBOL_MATCH_MARGIN
+
+EXCHANGE_SUFFIXES = {"NSE": ".NS", "BSE": ".BO"}
+
+ISIN_PATTERN = re.compile(r"^IN[EF][0-9A-Z]{9}$")
+
+# Words that statements add, drop or truncate freely ("LIMITE", "LIMI", "-EQ 5/-").
+NAME_STOPWORDS = {
+    "LTD", "LIMITED", "LIMITE", "LIMIT", "LIMI", "LIM", "THE", "CO", "EQ", "EQUITY",
+    "SHARES", "SHARE", "NEW", "RE", "RS", "FV", "OF", "AND",
+}
+
+_index = None
+_index_lock = threading.Lock()
+_listings = {}
+
+
+class AmbiguousSymbolError(ValueError):
+    pass
+
+
+def normalize_name(name):
+    words = re.sub(r"[^A-Z0-9& ]+", " ", name.upper().replace("&", " & ")).split()
+    return " ".join(w for w in words if w not in NAME_STOPWORDS and not w.isdigit())
+
+
+def _trigrams(text):
+    compact = f"  {text.replace(' ', '')} "
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+def _build_index():
+    entries = []
+    with open(SYMBOL_MASTER_PATH, newline="") as f:
+        for row in csv.DictReader(f):
+            aliases = [a for a in (row.get("aliases") or "").split("|") if a]
+            entries.append({
+                "symbol": row["symbol"],
+                "name": row["name"],
+                "isin": row.get("isin") or None,
+                "type": row.get("type") or "equity",
+                "keys": [normalize_name(n) for n in [row["name"]] + aliases],
+            })
+
+    by_symbol, by_isin, by_key, trigram_postings = {}, {}, {}, {}
+    prefix_keys = []
+    for entry_id, entry in enumerate(entries):
+        by_symbol[entry["symbol"].upper()] = entry_id
+        if entry["isin"]:
+            by_isin[entry["isin"]] = entry_id
+        for key in entry["keys"]:
+            by_key.setdefault(key, entry_id)
+            prefix_keys.append((key.replace(" ", ""), entry_id))
+            for gram in _trigrams(key):
+                trigram_postings.setdefault(gram, set()).add(entry_id)
+    prefix_keys.sort()
+    return {
+        "entries": entries,
+        "by_symbol": by_symbol,
+        "by_isin": by_isin,
+        "by_key": by_key,
+        "prefix_keys": prefix_keys,
+        "trigram_postings": trigram_postings,
+    }
+
+
+def _get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _build_index()
+    return _index
+
+
+def _to_ticker(entry, exchange):
+    if entry["type"] == "index":
+        return entry["symbol"]
+    return entry["symbol"] + EXCHANGE_SUFFIXES.get(exchange.upper(), ".NS")
+
+
+def _match(entry, exchange, score):
+    return {
+        "ticker": _to_ticker(entry, exchange),
+        "name": entry["name"],
+        "isin": entry["isin"],
+        "score": round(score, 3),
+    }
+
+
+def _prefix_matches(index, compact_query):
+    # Statements truncate long names, so the query may be a prefix of the master name.
+    prefix_keys = index["prefix_keys"]
+    position = bisect.bisect_left(prefix_keys, (compact_query, -1))
+    matches = []
+    while position < len(prefix_keys) and prefix_keys[position][0].startswith(compact_query):
+        matches.append(prefix_keys[position][1])
+        position += 1
+    return matches
+
+
+def search_symbols(query, exchange="NSE", limit=5):
+    index = _get_index()
+    query = query.strip()
+    upper_query = query.upper()
+
+    if ISIN_PATTERN.match(upper_query) and upper_query in index["by_isin"]:
+        return [_match(index["entries"][index["by_isin"][upper_query]], exchange, 1.0)]
+
+    bare_symbol = upper_query.rsplit(".", 1)[0] if upper_query.endswith((".NS", ".BO")) else upper_query
+    if bare_symbol in index["by_symbol"]:
+        return [_match(index["entries"][index["by_symbol"][bare_symbol]], exchange, 1.0)]
+
+    normalized = normalize_name(query)
+    if not normalized:
+        return []
+    if normalized in index["by_key"]:
+        return [_match(index["entries"][index["by_key"][normalized]], exchange, 1.0)]
+    if normalized.replace(" ", "") in index["by_symbol"]:
+        return [_match(index["entries"][index["by_symbol"][normalized.replace(" ", "")]], exchange, 1.0)]
+
+    compact_query = normalized.replace(" ", "")
+    prefix_ids = list(dict.fromkeys(_prefix_matches(index, compact_query)))
+    if len(compact_query) >= 6 and len(prefix_ids) == 1:
+        return [_match(index["entries"][prefix_ids[0]], exchange, 0.95)]
+
+    query_grams = _trigrams(normalized)
+    candidate_ids = set()
+    for gram in query_grams:
+        candidate_ids.update(index["trigram_postings"].get(gram, ()))
+
+    scored = []
+    for entry_id in candidate_ids:
+        best = max(_similarity(normalized, query_grams, key) for key in index["entries"][entry_id]["keys"])
+        scored.append((best, entry_id))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [_match(index["entries"][entry_id], exchange, score) for score, entry_id in scored[:limit]]
+
+
+def _similarity(normalized_query, query_grams, key):
+    key_grams = _trigrams(key)
+    dice = 2 * len(query_grams & key_grams) / (len(query_grams) + len(key_grams))
+    # Abbreviated words ("HIND ZINC" for "HINDUSTAN ZINC") are scored by word prefixes.
+    key_words = key.split()
+    query_words = normalized_query.split()
+    matched_words = sum(1 for q in query_words if any(k.startswith(q) for k in key_words))
+    return (dice + matched_words / len(query_words)) / 2
+
+
+def _has_own_listing(symbol):
+    """Whether the active market data provider quotes symbol as given; remembered per provider and symbol."""
+    key = (market_data.get_provider().name, symbol.upper())
+    if key not in _listings:
+        try:
+            _listings[key] = market_data.get_provider().has_listing(symbol)
+        except Exception as e:
+            # Not remembered, so the next lookup asks again.
+            print(f"Warning: Could not check whether {symbol} is listed as given: {e}")
+            return False
+    return _listings[key]
+
+
+def resolve_ticker(symbol, exchange="NSE"):
+    """
+    Maps a company name, ISIN or bare NSE symbol to a Yahoo ticker; anything else is returned unchanged.
+    A bare symbol that the provider also quotes as given (a US ticker sharing an NSE code) raises AmbiguousSymbolError.
+    """
+    cleaned = symbol.strip()
+    upper_symbol = cleaned.upper()
+    if upper_symbol.startswith("^") or upper_symbol.endswith(tuple(EXCHANGE_SUFFIXES.values())):
+        return cleaned
+    looks_like_ticker = re.fullmatch(r"[A-Z0-9&\-]{1,12}", upper_symbol) is not None
+    matches = search_symbols(cleaned, exchange=exchange, limit=2)
+    if not matches:
+        return cleaned
+    best = matches[0]
+    if looks_like_ticker and best["score"] < 1.0:
+        return cleaned
+    if len(matches) > 1 and best["score"] - matches[1]["score"] < SYMBOL_MATCH_MARGIN:
+        return cleaned
+    if best["score"] < SYMBOL_MATCH_THRESHOLD:
+        return cleaned
+    suffix_added = best["ticker"].rsplit(".", 1)[0] == upper_symbol and best["ticker"] != upper_symbol
+    if looks_like_ticker and suffix_added and _has_own_listing(upper_symbol):
+        raise AmbiguousSymbolError(
+            f"'{cleaned}' is quoted both as {upper_symbol} and as {best['ticker']} ({best['name']}). "
+            f"Call again with the ticker you mean."
+        )
+    return best["ticker"]
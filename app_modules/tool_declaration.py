@@ -1,3 +1,4 @@
+from google.genai import types
 from . import finance_tool, visualization_tool
 
 
@@ -5,12 +6,19 @@ ALL_GEMINI_TOOLS = [
     finance_tool.GEMINI_GET_STOCK_PRICE,
     finance_tool.GEMINI_GET_INDEX_VALUE,
     finance_tool.GEMINI_GET_PRICE_RANGE,
+    finance_tool.GEMINI_GET_PRICES_BATCH,
+    finance_tool.GEMINI_GET_PRICE_PERFORMANCE,
+    finance_tool.GEMINI_RESOLVE_TICKER,
     visualization_tool.VISUALIZATION_TOOL_GEMINI
 ]
+GEMINI_TOOL_CONFIG = types.Tool(function_declarations=ALL_GEMINI_TOOLS)
 ALL_OPENAI_TOOLS = [
     finance_tool.OPENAI_GET_STOCK_PRICE,
     finance_tool.OPENAI_GET_INDEX_VALUE,
     finance_tool.OPENAI_GET_PRICE_RANGE,
+    finance_tool.OPENAI_GET_PRICES_BATCH,
+    finance_tool.OPENAI_GET_PRICE_PERFORMANCE,
+    finance_tool.OPENAI_RESOLVE_TICKER,
     visualization_tool.VISUALIZATION_TOOL_OPENAI,
 ]
 
@@ -18,5 +26,8 @@ TOOL_IMPLEMENTATIONS = {
     "get_historical_stock_price": finance_tool.get_historical_stock_price_impl,
     "get_historical_index_value": finance_tool.get_historical_index_value_impl,
     "get_historical_price_range": finance_tool.get_historical_price_range_impl,
+    "get_historical_prices_batch": finance_tool.get_historical_prices_batch_impl,
+    "get_price_performance": finance_tool.get_price_performance_impl,
+    "resolve_ticker_symbol": finance_tool.resolve_ticker_symbol_impl,
     "display_comparison_chart": visualization_tool.create_comparison_chart
 }
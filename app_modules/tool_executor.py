@@ -0,0 +1,137 @@
+# app_modules/tool_executor.py
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from .app_config import TOOL_EXECUTOR_MAX_WORKERS, TOOL_CALL_TIMEOUT_SECONDS
+from .tool_declaration import TOOL_IMPLEMENTATIONS
+
+_executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_MAX_WORKERS, thread_name_prefix="tool-call")
+_executor_lock = threading.Lock()
+# Futures of timed-out calls whose worker thread is still running them; a thread cannot be stopped from outside.
+_abandoned = set()
+
+
+class _ToolCall:
+    def __init__(self, tool_name):
+        self.tool_name = tool_name
+        self.future = None
+        self.executor = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+
+    def deadline(self, timeout):
+        """Each call gets timeout seconds from when a worker picks it up, or from submission while it is still queued."""
+        return (self.started_at or self.submitted_at) + timeout
+
+
+def _run_in_context(call, script_run_ctx, tool_function, tool_args):
+    call.started_at = time.monotonic()
+    # Tools such as display_comparison_chart write to st.session_state, which needs the caller's script context.
+    if script_run_ctx is not None:
+        add_script_run_ctx(threading.current_thread(), script_run_ctx)
+    return tool_function(**tool_args)
+
+
+def current_script_context():
+    """The calling thread's Streamlit script context, to hand to run_tool_calls_async from another thread."""
+    return get_script_run_ctx(suppress_warning=True)
+
+
+def abandoned_workers():
+    """Number of worker threads still busy with calls that already timed out."""
+    with _executor_lock:
+        return len(_abandoned)
+
+
+def _release_abandoned(future):
+    with _executor_lock:
+        _abandoned.discard(future)
+
+
+def _abandon(call, timeout):
+    """Report a call that overran its timeout and, once half the pool is stuck, start a fresh pool for later turns."""
+    global _executor
+    print(f"Warning: Tool {call.tool_name} timed out after {timeout} seconds and is still occupying a tool worker.")
+    with _executor_lock:
+        if call.executor is not _executor:
+            return  # Its pool has already been replaced
+        _abandoned.add(call.future)
+        if len(_abandoned) >= max(1, TOOL_EXECUTOR_MAX_WORKERS // 2):
+            print(f"Warning: {len(_abandoned)} tool workers are stuck on timed-out calls; starting a fresh tool pool.")
+            # The stuck threads finish (or hang) on their own; the old pool just stops taking new work.
+            _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_MAX_WORKERS, thread_name_prefix="tool-call")
+            _abandoned.clear()
+            return
+    call.future.add_done_callback(_release_abandoned)
+
+
+def _submit(tool_calls, script_run_ctx):
+    calls = []
+    with _executor_lock:
+        executor = _executor
+    for tool_name, tool_args in tool_calls:
+        call = _ToolCall(tool_name)
+        tool_function = TOOL_IMPLEMENTATIONS.get(tool_name)
+        if tool_function is not None:
+            call.executor = executor
+            call.future = executor.submit(_run_in_context, call, script_run_ctx, tool_function, tool_args)
+        calls.append(call)
+    return calls
+
+
+def _outputs(calls, timeout):
+    outputs = []
+    for call in calls:
+        if call.future is None:
+            outputs.append(json.dumps({"error": f"Unknown tool: {call.tool_name}"}))
+        elif not call.future.done():
+            if call.future.cancel():
+                outputs.append(json.dumps({"error": f"Tool {call.tool_name} could not start within {timeout} seconds; all tool workers are busy."}))
+            else:
+                _abandon(call, timeout)
+                outputs.append(json.dumps({"error": f"Tool {call.tool_name} timed out after {timeout} seconds."}))
+        elif call.future.exception() is not None:
+            outputs.append(json.dumps({"error": f"Failed to execute tool {call.tool_name}: {str(call.future.exception())}"}))
+        else:
+            outputs.append(call.future.result())
+    return outputs
+
+
+def _pending(calls, timeout):
+    now = time.monotonic()
+    return [call for call in calls if call.future is not None and not call.future.done() and call.deadline(timeout) > now]
+
+
+def run_tool_calls(tool_calls, timeout=TOOL_CALL_TIMEOUT_SECONDS):
+    """
+    Run every (name, args) tool call of one model turn concurrently, each limited to timeout seconds of running time.
+    Returns one output per call, in order; unknown tools, failures and timeouts become a JSON {"error": ...} string.
+    """
+    calls = _submit(tool_calls, current_script_context())
+    while True:
+        pending = _pending(calls, timeout)
+        if not pending:
+            break
+        next_deadline = min(call.deadline(timeout) for call in pending)
+        wait([call.future for call in pending], timeout=max(0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+    return _outputs(calls, timeout)
+
+
+async def run_tool_calls_async(tool_calls, script_run_ctx=None, timeout=TOOL_CALL_TIMEOUT_SECONDS):
+    """run_tool_calls for coroutines: the tools still run on the thread pool, the event loop only awaits them."""
+    calls = _submit(tool_calls, script_run_ctx)
+    awaitables = {call: asyncio.wrap_future(call.future) for call in calls if call.future is not None}
+    while True:
+        pending = _pending(calls, timeout)
+        if not pending:
+            break
+        next_deadline = min(call.deadline(timeout) for call in pending)
+        await asyncio.wait(
+            [awaitables[call] for call in pending],
+            timeout=max(0, next_deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED,
+        )
+    return _outputs(calls, timeout)
@@ -0,0 +1,150 @@
+# app_modules/trading_calendar.py
+import datetime
+
+# NSE and BSE share the equity-segment holiday list.
+EXCHANGE_HOLIDAYS = {
+    2023: [
+        "2023-01-26", "2023-03-07", "2023-03-30", "2023-04-04", "2023-04-07",
+        "2023-04-14", "2023-05-01", "2023-06-29", "2023-08-15", "2023-09-19",
+        "2023-10-02", "2023-10-24", "2023-11-14", "2023-11-27", "2023-12-25",
+    ],
+    2024: [
+        "2024-01-22", "2024-01-26", "2024-03-08", "2024-03-25", "2024-03-29",
+        "2024-04-11", "2024-04-17", "2024-05-01", "2024-05-20", "2024-06-17",
+        "2024-07-17", "2024-08-15", "2024-10-02", "2024-11-01", "2024-11-15",
+        "2024-11-20", "2024-12-25",
+    ],
+    2025: [
+        "2025-02-26", "2025-03-14", "2025-03-31", "2025-04-10", "2025-04-14",
+        "2025-04-18", "2025-05-01", "2025-08-15", "2025-08-27", "2025-10-02",
+        "2025-10-21", "2025-10-22", "2025-11-05", "2025-12-25",
+    ],
+    2026: [
+        "2026-01-15", "2026-01-26", "2026-03-03", "2026-03-26", "2026-03-31",
+        "2026-04-03", "2026-04-14", "2026-05-01", "2026-05-28", "2026-06-26",
+        "2026-09-14", "2026-10-02", "2026-10-20", "2026-11-10", "2026-11-24",
+        "2026-12-25",
+    ],
+}
+
+# Shortened or out-of-schedule sessions held on a holiday or weekend.
+SPECIAL_SESSIONS = {
+    "2023-11-12": "Muhurat trading (short session)",
+    "2024-01-20": "Special Saturday session",
+    "2024-03-02": "Special Saturday session",
+    "2024-11-01": "Muhurat trading (short session)",
+    "2025-02-01": "Union Budget Saturday session",
+    "2025-10-21": "Muhurat trading (short session)",
+    "2026-02-01": "Union Budget Sunday session",
+}
+
+INDIAN_SYMBOL_SUFFIXES = (".NS", ".BO")
+INDIAN_INDEX_PREFIXES = ("^NSE", "^BSE", "^CNX", "^NIFTY", "^INDIAVIX", "^NSMIDCP", "^CRSLDX")
+
+CALENDAR_START = datetime.date(min(EXCHANGE_HOLIDAYS), 1, 1)
+CALENDAR_END = datetime.date(max(EXCHANGE_HOLIDAYS), 12, 31)
+
+SNAP_PREVIOUS = "previous"
+SNAP_NEXT = "next"
+SNAP_EXACT = "exact"
+SNAP_MODES = (SNAP_PREVIOUS, SNAP_NEXT, SNAP_EXACT)
+
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+INDIAN_SESSION_CLOSE = datetime.time(15, 30)
+# Latest timezone a listed market trades in; with no calendar for other exchanges, a day is over once it ends there.
+LAST_MARKET_TIMEZONE = datetime.timezone(datetime.timedelta(hours=-10))
+
+
+def _build_index():
+    holidays = {datetime.date.fromisoformat(d) for days in EXCHANGE_HOLIDAYS.values() for d in days}
+    special = {datetime.date.fromisoformat(d) for d in SPECIAL_SESSIONS}
+    all_days = [
+        CALENDAR_START + datetime.timedelta(days=offset)
+        for offset in range((CALENDAR_END - CALENDAR_START).days + 1)
+    ]
+    sessions = {
+        day for day in all_days
+        if day in special or (day.weekday() < 5 and day not in holidays)
+    }
+
+    previous_session, next_session = {}, {}
+    last_seen = None
+    for day in all_days:
+        if day in sessions:
+            last_seen = day
+        previous_session[day] = last_seen
+    last_seen = None
+    for day in reversed(all_days):
+        if day in sessions:
+            last_seen = day
+        next_session[day] = last_seen
+    return sessions, previous_session, next_session
+
+
+_SESSIONS, _PREVIOUS_SESSION, _NEXT_SESSION = _build_index()
+
+
+def is_indian_symbol(symbol):
+    symbol = symbol.upper()
+    return symbol.endswith(INDIAN_SYMBOL_SUFFIXES) or symbol.startswith(INDIAN_INDEX_PREFIXES)
+
+
+def is_trading_day(day):
+    if CALENDAR_START <= day <= CALENDAR_END:
+        return day in _SESSIONS
+    return day.weekday() < 5
+
+
+def is_session_for_symbol(symbol, day):
+    if is_indian_symbol(symbol):
+        return is_trading_day(day)
+    return day.weekday() < 5
+
+
+def session_close_timestamp(symbol, day):
+    """POSIX time at which day's session for symbol has ended, i.e. when its close becomes final."""
+    if not is_indian_symbol(symbol):
+        return datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(0), LAST_MARKET_TIMEZONE).timestamp()
+    if get_special_session(day):
+        # Muhurat and other special sessions run at irregular hours, often in the evening.
+        return datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(0), IST).timestamp()
+    return datetime.datetime.combine(day, INDIAN_SESSION_CLOSE, IST).timestamp()
+
+
+def get_special_session(day):
+    return SPECIAL_SESSIONS.get(day.isoformat())
+
+
+def _validate_snap(snap):
+    if snap not in SNAP_MODES:
+        raise ValueError(f"Unknown snap mode '{snap}'; expected one of {', '.join(SNAP_MODES)}.")
+
+
+def resolve_trading_day(day, snap=SNAP_PREVIOUS):
+    _validate_snap(snap)
+    if snap == SNAP_EXACT or is_trading_day(day):
+        return day
+    if CALENDAR_START <= day <= CALENDAR_END:
+        lookup = _PREVIOUS_SESSION if snap == SNAP_PREVIOUS else _NEXT_SESSION
+        resolved = lookup[day]
+        if resolved is not None:
+            return resolved
+
+    # Outside the precomputed years only weekends are skipped.
+    step = datetime.timedelta(days=-1 if snap == SNAP_PREVIOUS else 1)
+    while not is_trading_day(day):
+        day += step
+    return day
+
+
+def resolve_session_for_symbol(symbol, day, snap=SNAP_PREVIOUS):
+    _validate_snap(snap)
+    if is_indian_symbol(symbol):
+        return resolve_trading_day(day, snap)
+    if snap == SNAP_EXACT:
+        return day
+    # No holiday calendar for other exchanges: only weekends are skipped.
+    step = datetime.timedelta(days=-1 if snap == SNAP_PREVIOUS else 1)
+    while day.weekday() >= 5:
+        day += step
+    return day
@@ -3,7 +3,7 @@ from streamlit_pdf_viewer import pdf_viewer
 import os
 import plotly.io as pio
 from . import app_config
-from . import chat_utils
+from . import chat_utils, visualization_tool
 
 def render_sidebar_content(authenticator):
 
@@ -78,8 +78,7 @@ def render_sidebar_content(authenticator):
             col1, col2 = st.columns([1, 1])
             with col1:
                 if st.button(f"🗑️ Clear Chat", key=f"delete_{st.session_state.active_chat}", help="Delete all messages", use_container_width=True, disabled=is_processing):
-                    chat_utils.save_chat(active_profile_key, st.session_state.active_chat, {"pdf_path": predefined_chats_for_profile[st.session_state.active_chat], "messages": []})
-                    st.session_state.chats[st.session_state.active_chat]["messages"] = []
+                    chat_utils.clear_chat(active_profile_key, st.session_state.active_chat, st.session_state.chats[st.session_state.active_chat], user=st.session_state.get("username"))
                     st.rerun()
             with col2:
                 if st.button("📄 View PDF", key=f"view_pdf_{st.session_state.active_chat}", use_container_width=True, disabled=is_processing):
@@ -114,13 +113,38 @@ def display_pdf_modal():
                     st.markdown(os.path.basename(_pdf_path_for_dialog_display), unsafe_allow_html=True)
                 view_pdf_in_dialog_function_content()
 
-def display_chat_history(current_chat_messages):
-    for msg in current_chat_messages:
+def _show_earlier_messages(window_key, profile_key, chat_title, chat_data, user):
+    st.session_state[window_key] += app_config.CHAT_HISTORY_WINDOW
+    shortfall = st.session_state[window_key] - len(chat_data["messages"])
+    if shortfall > 0:
+        chat_utils.load_earlier_messages(profile_key, chat_title, chat_data, user=user, limit=shortfall)
+
+@st.fragment
+def display_chat_history(profile_key, chat_title, chat_data, user, window_key):
+    """
+    Render the newest messages of the chat, CHAT_HISTORY_WINDOW at a time; "Load earlier messages" reveals older
+    loaded ones and pages further ones in from the chat store. As a fragment, the button reruns only the history.
+    """
+    current_chat_messages = chat_utils.get_messages(profile_key, chat_title, chat_data, user=user)
+    if window_key not in st.session_state:
+        st.session_state[window_key] = app_config.CHAT_HISTORY_WINDOW
+    shown_from = max(len(current_chat_messages) - st.session_state[window_key], 0)
+    hidden_count = shown_from + chat_utils.earlier_message_count(chat_data)
+    if hidden_count:
+        st.button(
+            f"Load earlier messages ({hidden_count} hidden)", key=f"{window_key}_button",
+            on_click=_show_earlier_messages, args=(window_key, profile_key, chat_title, chat_data, user),
+        )
+
+    for msg in current_chat_messages[shown_from:]:
         with st.chat_message(msg["role"]):
             content_type = msg.get("type", "text")
             if content_type == "chart":
                 try:
-                    fig = pio.from_json(msg["content"])
+                    if isinstance(msg["content"], dict):
+                        fig = visualization_tool.get_chart_figure(msg["content"])
+                    else:
+                        fig = pio.from_json(msg["content"])  # Charts saved before specs were stored as Plotly JSON
                     st.plotly_chart(fig, use_container_width=True)
                 except Exception as e:
                     st.error(f"Could not display chart from history: {e}")
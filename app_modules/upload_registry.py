@@ -0,0 +1,61 @@
+# app_modules/upload_registry.py
+import time
+import threading
+from . import pdf_extraction
+
+PROVIDER_GEMINI = "gemini"
+PROVIDER_OPENAI = "openai"
+PROVIDER_OPENAI_VECTOR_STORE = "openai_vector_store"
+
+_entries = {}
+_key_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _key_lock(key):
+    with _locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def _live_handle(key):
+    entry = _entries.get(key)
+    if entry and entry["expires_at"] > time.time():
+        return entry["handle"]
+    return None
+
+
+def get_or_upload(provider, pdf_path, upload, revalidate=None):
+    """
+    Remote handle for pdf_path on provider, shared by every chat that points at the same bytes.
+    upload(pdf_path) -> (handle, expires_at); revalidate(handle) -> new expires_at, or None if the remote copy is gone.
+    """
+    key = (provider, pdf_extraction.file_sha256(pdf_path))
+    handle = _live_handle(key)
+    if handle is not None:
+        return handle
+
+    with _key_lock(key):
+        handle = _live_handle(key)
+        if handle is not None:
+            return handle
+
+        entry = _entries.get(key)
+        if entry and revalidate:
+            try:
+                expires_at = revalidate(entry["handle"])
+                if expires_at and expires_at > time.time():
+                    entry["expires_at"] = expires_at
+                    return entry["handle"]
+            except Exception as e:
+                print(f"Warning: Could not revalidate {provider} upload of {pdf_path}: {e}")
+
+        handle, expires_at = upload(pdf_path)
+        _entries[key] = {"handle": handle, "expires_at": expires_at, "uploaded_at": time.time()}
+        return handle
+
+
+def invalidate(provider, pdf_path):
+    """Forget the upload, e.g. after the provider rejected the stored handle."""
+    key = (provider, pdf_extraction.file_sha256(pdf_path))
+    with _key_lock(key):
+        _entries.pop(key, None)
@@ -1,14 +1,24 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
 import streamlit as st
 import plotly.express as px
 import pandas as pd
 from google.genai.types import FunctionDeclaration, Schema, Tool, Type
+from .app_config import CHART_FIGURE_CACHE_SIZE
 
-def create_comparison_chart(data, title, chart_type='bar', x_axis='item', y_axis='value'):
-    if not data or not all(x_axis in d and y_axis in d for d in data):
-        st.warning("Chart could not be generated due to incomplete data from the AI.")
-        return None
-    
-    df = pd.DataFrame(data)
+_figure_cache = OrderedDict()
+_figure_cache_lock = threading.Lock()
+_pending_charts_lock = threading.Lock()
+
+def chart_spec(data, title, chart_type='bar', x_axis='item', y_axis='value'):
+    """Everything needed to rebuild a chart; this, not the Plotly figure JSON, is what chat history stores."""
+    return {"chart_type": chart_type, "title": title, "x_axis": x_axis, "y_axis": y_axis, "data": data}
+
+def build_chart_figure(spec):
+    chart_type, title, x_axis, y_axis = spec["chart_type"], spec["title"], spec["x_axis"], spec["y_axis"]
+    df = pd.DataFrame(spec["data"])
     
     if chart_type.lower() == 'pie':
         fig = px.pie(df, names=x_axis, values=y_axis, title=title, hole=0.3)
@@ -32,7 +42,34 @@ def create_comparison_chart(data, title, chart_type='bar', x_axis='item', y_axis
         legend_title=None,
         showlegend=(chart_type.lower() != 'line') 
     )
-    st.session_state.figure_to_display = fig
+    return fig
+
+def get_chart_figure(spec):
+    """Figure for spec from an LRU cache keyed by the spec's hash, so reruns do not rebuild every chart in the history."""
+    spec_hash = hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    with _figure_cache_lock:
+        fig = _figure_cache.get(spec_hash)
+        if fig is not None:
+            _figure_cache.move_to_end(spec_hash)
+            return fig
+
+    fig = build_chart_figure(spec)
+    with _figure_cache_lock:
+        _figure_cache[spec_hash] = fig
+        while len(_figure_cache) > CHART_FIGURE_CACHE_SIZE:
+            _figure_cache.popitem(last=False)
+    return fig
+
+def create_comparison_chart(data, title, chart_type='bar', x_axis='item', y_axis='value'):
+    if not data or not all(x_axis in d and y_axis in d for d in data):
+        st.warning("Chart could not be generated due to incomplete data from the AI.")
+        return None
+
+    spec = chart_spec(data, title, chart_type, x_axis, y_axis)
+    get_chart_figure(spec)
+    # A turn can chart several times, in parallel tool calls; every chart is kept in call-completion order.
+    with _pending_charts_lock:
+        st.session_state.setdefault("chart_specs_to_display", []).append(spec)
     return f"Success: The chart titled '{title}' has been generated and is ready for display."
 
 # For Gemini
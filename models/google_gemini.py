@@ -1,10 +1,172 @@
 #  models/gemini_interactions.py
 import streamlit as st
 import os
-import json
+import time
 from google import genai
 from google.genai import types
-from app_modules import app_config, tool_declaration
+from app_modules import app_config, chat_utils, tool_declaration, tool_executor, page_retrieval, upload_registry, gemini_cache_pool, provider_loop, provider_clients
+
+
+def _gemini_file_expiry(uploaded_file):
+    expires_at = time.time() + app_config.GEMINI_FILE_TTL_SECONDS
+    if uploaded_file.expiration_time:
+        expires_at = min(expires_at, uploaded_file.expiration_time.timestamp() - app_config.UPLOAD_EXPIRY_MARGIN_SECONDS)
+    return expires_at
+
+
+def get_uploaded_pdf(client: genai.Client, pdf_path: str):
+    """The Gemini File for pdf_path, uploaded once per distinct file content and reused until it expires."""
+    def upload(path):
+        uploaded_file = client.files.upload(file=path)
+        return uploaded_file, _gemini_file_expiry(uploaded_file)
+
+    def revalidate(uploaded_file):
+        current = client.files.get(name=uploaded_file.name)
+        if current.state and current.state.name == "ACTIVE":
+            return _gemini_file_expiry(current)
+        return None
+
+    return upload_registry.get_or_upload(upload_registry.PROVIDER_GEMINI, pdf_path, upload, revalidate)
+
+
+def _cache_name_marker():
+    return f"_cache_{app_config.FIXED_MODEL_ID.replace('.', '_')}_"
+
+
+def _cache_display_name(pdf_path, cache_key):
+    return f"{os.path.basename(pdf_path)}{_cache_name_marker()}{gemini_cache_pool.key_label(cache_key)}"
+
+
+def get_cache_key(pdf_path, system_instruction_str, gemini_tool_config):
+    return gemini_cache_pool.pool_key(
+        pdf_path, app_config.MODEL_TO_USE_FOR_API, system_instruction_str,
+        gemini_tool_config.model_dump_json(exclude_none=True)
+    )
+
+
+def _cache_expiry(cached_content):
+    if cached_content.expire_time:
+        return cached_content.expire_time.timestamp()
+    return time.time() + app_config.GEMINI_CACHE_TTL_SECONDS
+
+
+def _cache_extender(client: genai.Client):
+    def extend(cache_name):
+        updated_cache = client.caches.update(
+            name=cache_name, config=types.UpdateCachedContentConfig(ttl=f"{app_config.GEMINI_CACHE_TTL_SECONDS}s")
+        )
+        return _cache_expiry(updated_cache)
+    return extend
+
+
+def get_shared_cache(client: genai.Client, cache_key, pdf_path, system_instruction_str, gemini_tool_config):
+    """Name of the context cache shared by every chat on this document, built once however many users arrive together."""
+    def create():
+        st.toast(f"Processing and caching {os.path.basename(pdf_path)} for Q&A. This may take a moment...", icon="⏳")
+        create_cache_config = types.CreateCachedContentConfig(
+            display_name=_cache_display_name(pdf_path, cache_key),
+            system_instruction=system_instruction_str,
+            contents=[get_uploaded_pdf(client, pdf_path)],
+            tools=[gemini_tool_config],
+            ttl=f"{app_config.GEMINI_CACHE_TTL_SECONDS}s",
+        )
+        new_cache = client.caches.create(model=app_config.MODEL_TO_USE_FOR_API, config=create_cache_config)
+        return new_cache.name, _cache_expiry(new_cache)
+
+    return gemini_cache_pool.get_or_create(cache_key, create, extend=_cache_extender(client))
+
+
+def delete_unreferenced_caches(api_key):
+    """
+    Delete this app's caches that no saved chat names and that no worker has created or extended, and this process
+    has not used, for GEMINI_CACHE_IDLE_SECONDS. Chat headers are shared by every worker, and so is the cache's
+    update_time, which each TTL extension moves.
+    """
+    client = provider_clients.get_gemini_client(api_key)
+    referenced = chat_utils.referenced_gemini_caches()
+    idle_since = time.time() - app_config.GEMINI_CACHE_IDLE_SECONDS
+    for cached_content in client.caches.list():
+        if _cache_name_marker() not in (cached_content.display_name or "") or cached_content.name in referenced:
+            continue
+        touched = [t.timestamp() for t in (cached_content.create_time, cached_content.update_time) if t]
+        if not touched or max(touched) > idle_since or gemini_cache_pool.used_since(cached_content.name, idle_since):
+            continue
+        try:
+            client.caches.delete(name=cached_content.name)
+            gemini_cache_pool.forget(cached_content.name)
+        except Exception as e:
+            print(f"Warning: Could not delete idle Gemini cache {cached_content.name}: {e}")
+
+
+def start_cache_reaper(api_key):
+    gemini_cache_pool.start_reaper(lambda: delete_unreferenced_caches(api_key))
+
+
+def _find_existing_cache(client: genai.Client, cache_key, current_chat_data, pdf_path):
+    """The pooled cache for cache_key, checked against the locally tracked expiry; the API is only asked about a chat's stored cache after a restart."""
+    cache_name = gemini_cache_pool.get_cached(cache_key, extend=_cache_extender(client))
+    if cache_name:
+        return cache_name
+
+    stored_name = current_chat_data.get("gemini_cache_name")
+    if not stored_name:
+        return None
+
+    try:
+        cache_info = client.caches.get(name=stored_name)
+        if cache_info.model == app_config.MODEL_TO_USE_FOR_API and \
+           cache_info.display_name == _cache_display_name(pdf_path, cache_key):
+            return gemini_cache_pool.adopt(cache_key, stored_name, _cache_expiry(cache_info))
+    except Exception:
+        pass
+
+    current_chat_data["gemini_cache_name"] = None
+    current_chat_data["gemini_cache_model"] = None
+    return None
+
+def _merge_text_parts(parts):
+    merged = []
+    for part in parts:
+        is_plain_text = part.text is not None and not part.function_call and not part.thought and not part.thought_signature
+        if is_plain_text and merged and merged[-1].text is not None and not merged[-1].function_call and \
+           not merged[-1].thought and not merged[-1].thought_signature:
+            merged[-1] = types.Part(text=merged[-1].text + part.text)
+        else:
+            merged.append(part)
+    return merged
+
+
+async def generate_async(client: genai.Client, contents, config):
+    return await client.aio.models.generate_content(model=app_config.MODEL_TO_USE_FOR_API, contents=contents, config=config)
+
+
+async def generate_streaming_async(client: genai.Client, contents, config, emit):
+    """
+    generate_content over a stream: emit receives the answer text accumulated so far after every chunk.
+    Returns a single response shaped like generate_content's, with the streamed parts (text and function calls) merged.
+    """
+    streamed_parts, streamed_text = [], ""
+    last_response, last_candidate = None, None
+    stream = await client.aio.models.generate_content_stream(model=app_config.MODEL_TO_USE_FOR_API, contents=contents, config=config)
+    async for chunk in stream:
+        last_response = chunk
+        if not chunk.candidates:
+            continue
+        last_candidate = chunk.candidates[0]
+        if not (last_candidate.content and last_candidate.content.parts):
+            continue
+        for part in last_candidate.content.parts:
+            streamed_parts.append(part)
+            if part.text and not part.thought:
+                streamed_text += part.text
+                emit(streamed_text)
+
+    if last_response is None or last_candidate is None:
+        return last_response
+
+    merged_content = types.Content(role="model", parts=_merge_text_parts(streamed_parts)) if streamed_parts else None
+    return last_response.model_copy(update={"candidates": [last_candidate.model_copy(update={"content": merged_content})]})
+
 
 def generate_gemini_response(
     client: genai.Client,
@@ -13,52 +175,41 @@ def generate_gemini_response(
     current_chat_data: dict,
     chat_pdf_path: str,
     system_instruction_str: str,
-    gemini_tool_config: types.Tool
+    gemini_tool_config: types.Tool,
+    document_mode: str = app_config.DOCUMENT_MODE_FULL,
+    on_text=None
 ):
     api_conversation_history = []
     uploaded_file_for_api_content = None
+    use_retrieval = document_mode == app_config.DOCUMENT_MODE_RETRIEVAL
 
-    _stored_cache_name_from_session = current_chat_data.get("gemini_cache_name")
-    _stored_cache_model_from_session = current_chat_data.get("gemini_cache_model")
-    _cache_creation_failed_persistently = current_chat_data.get("cache_creation_failed", False)
-
+    # A failed cache creation never pins a chat to the uncached path: the pool backs off the document for
+    # GEMINI_CACHE_FAILURE_BACKOFF_SECONDS and each turn in between answers without a cache. The cache_creation_failed
+    # field older chats still carry in their headers is ignored.
     cache_name_for_generation = None
+    cache_key = None
 
-    if _stored_cache_name_from_session and not _cache_creation_failed_persistently:
-        try:
-            cache_info = client.caches.get(name=_stored_cache_name_from_session)
-            if cache_info.model == app_config.MODEL_TO_USE_FOR_API and \
-               _stored_cache_model_from_session == app_config.MODEL_TO_USE_FOR_API:
-                cache_name_for_generation = _stored_cache_name_from_session
-            else:
-                try: client.caches.delete(name=_stored_cache_name_from_session)
-                except Exception: pass
-                current_chat_data["gemini_cache_name"] = None
-                current_chat_data["gemini_cache_model"] = None
-                current_chat_data["cache_creation_failed"] = False
-        except Exception:
-            current_chat_data["gemini_cache_name"] = None
-            current_chat_data["gemini_cache_model"] = None
-            current_chat_data["cache_creation_failed"] = False
-
-    should_use_fallback_definitively = (_cache_creation_failed_persistently and not cache_name_for_generation) or \
-                                       (not cache_name_for_generation and current_chat_data.get("cache_creation_failed", False) and not _stored_cache_name_from_session)
-
-    if should_use_fallback_definitively:
+    if not use_retrieval and os.path.exists(chat_pdf_path):
+        cache_key = get_cache_key(chat_pdf_path, system_instruction_str, gemini_tool_config)
+        cache_name_for_generation = _find_existing_cache(client, cache_key, current_chat_data, chat_pdf_path)
+        if cache_name_for_generation:
+            current_chat_data["gemini_cache_name"] = cache_name_for_generation
+            current_chat_data["gemini_cache_model"] = app_config.MODEL_TO_USE_FOR_API
+
+    if use_retrieval:
         if not os.path.exists(chat_pdf_path):
-            st.error(f"PDF file not found for direct processing: {chat_pdf_path}")
+            st.error(f"PDF file not found for page retrieval: {chat_pdf_path}")
             return "Error: PDF file for chat not found.", current_chat_data
 
-        uploaded_file_for_api_content = client.files.upload(file=chat_pdf_path)
-        api_conversation_history = [
-            types.Content(role="user", parts=[types.Part(text=system_instruction_str)]),
-            uploaded_file_for_api_content
-        ]
+        previous_user_turns = [msg["content"] for msg in current_chat_messages[:-1] if msg["role"] == "user"]
+        retrieval_query = " ".join(previous_user_turns[-1:] + [user_query])
+        page_context = page_retrieval.build_page_context(chat_pdf_path, retrieval_query)
         for msg in current_chat_messages[:-1]:
             role_for_api = "model" if msg["role"] == "assistant" else msg["role"]
-            if not (msg["role"] == "user" and msg["content"] == system_instruction_str):
-                api_conversation_history.append(types.Content(role=role_for_api, parts=[types.Part(text=msg["content"])]))
-        api_conversation_history.append(types.Content(role="user", parts=[types.Part(text=user_query)]))
+            api_conversation_history.append(types.Content(role=role_for_api, parts=[types.Part(text=msg["content"])]))
+        api_conversation_history.append(
+            types.Content(role="user", parts=[types.Part(text=page_context), types.Part(text=user_query)])
+        )
 
     else:
         if not cache_name_for_generation:
@@ -78,66 +229,48 @@ def generate_gemini_response(
     # --- Actual API Call Logic ---
     answer_text = "Error: Could not retrieve a valid response from the model."
     use_fallback_for_this_run = False
-    uploaded_file_for_cache_ref = None
 
     try:
         MAX_FUNCTION_CALLS = 5
         num_function_calls = 0
 
         while num_function_calls < MAX_FUNCTION_CALLS:
-            if not cache_name_for_generation and not should_use_fallback_definitively and not use_fallback_for_this_run:
-                if not current_chat_data.get("cache_creation_failed", False):
-                    if not os.path.exists(chat_pdf_path):
-                        st.error(f"PDF file not found for cache processing: {chat_pdf_path}")
+            if not use_retrieval and not cache_name_for_generation and not use_fallback_for_this_run:
+                if not cache_key:
+                    st.error(f"PDF file not found for cache processing: {chat_pdf_path}")
+                    use_fallback_for_this_run = True
+                else:
+                    try:
+                        cache_name_for_generation = get_shared_cache(
+                            client, cache_key, chat_pdf_path, system_instruction_str, gemini_tool_config
+                        )
+                    except Exception as e_create:
+                        # The pool backs off from retrying this document, so the failure only affects this turn.
+                        print(f"Warning: Could not create Gemini cache for {chat_pdf_path}: {e_create}")
+                        cache_name_for_generation = None
+                        current_chat_data["gemini_cache_name"] = None
+                        current_chat_data["gemini_cache_model"] = None
+
+                    if not cache_name_for_generation:
+                        # Creation failed now or recently (the pool is backing off): answer without a cache this turn.
                         use_fallback_for_this_run = True
-                        current_chat_data["cache_creation_failed"] = True
                     else:
-                        st.toast(f"Processing and caching {os.path.basename(chat_pdf_path)} for Q&A. This may take a moment...", icon="⏳")
-                        uploaded_file_for_cache_ref = None
-                        try:
-                            uploaded_file_for_cache_ref = client.files.upload(file=chat_pdf_path)
-                            create_cache_config = types.CreateCachedContentConfig(
-                                display_name=f"{os.path.basename(chat_pdf_path)}_cache_{app_config.FIXED_MODEL_ID.replace('.', '_')}",
-                                system_instruction=system_instruction_str,
-                                contents=[uploaded_file_for_cache_ref],
-                                tools=[gemini_tool_config],
-                                ttl="3600s",
-                            )
-                            new_cache = client.caches.create(
-                                model=app_config.MODEL_TO_USE_FOR_API,
-                                config=create_cache_config
-                            )
-                            cache_name_for_generation = new_cache.name
-                            current_chat_data["gemini_cache_name"] = cache_name_for_generation
-                            current_chat_data["gemini_cache_model"] = app_config.MODEL_TO_USE_FOR_API
-                            current_chat_data["cache_creation_failed"] = False
-
-
-                            temp_history_for_new_cache = []
-                            for msg_hist in current_chat_messages:
-                                role_hist = "model" if msg_hist["role"] == "assistant" else msg_hist["role"]
-                                if not (msg_hist["role"] == "user" and msg_hist["content"] == system_instruction_str):
-                                    temp_history_for_new_cache.append(types.Content(role=role_hist, parts=[types.Part(text=msg_hist["content"])]))
-                            api_conversation_history = temp_history_for_new_cache
-
-                        except Exception as e_create:
-                            use_fallback_for_this_run = True
-                            current_chat_data["cache_creation_failed"] = True
-                            current_chat_data["gemini_cache_name"] = None
-                            current_chat_data["gemini_cache_model"] = None
-                        finally:
-                            if uploaded_file_for_cache_ref:
-                                try: client.files.delete(name=uploaded_file_for_cache_ref.name)
-                                except Exception: pass
-                else:
-                    use_fallback_for_this_run = True
+                        current_chat_data["gemini_cache_name"] = cache_name_for_generation
+                        current_chat_data["gemini_cache_model"] = app_config.MODEL_TO_USE_FOR_API
 
-            if should_use_fallback_definitively or use_fallback_for_this_run:
+                        temp_history_for_new_cache = []
+                        for msg_hist in current_chat_messages:
+                            role_hist = "model" if msg_hist["role"] == "assistant" else msg_hist["role"]
+                            if not (msg_hist["role"] == "user" and msg_hist["content"] == system_instruction_str):
+                                temp_history_for_new_cache.append(types.Content(role=role_hist, parts=[types.Part(text=msg_hist["content"])]))
+                        api_conversation_history = temp_history_for_new_cache
+
+            if use_fallback_for_this_run:
                 if not uploaded_file_for_api_content:
                     if not os.path.exists(chat_pdf_path):
                         st.error(f"PDF file not found for fallback processing: {chat_pdf_path}")
                         return f"Error: PDF file not found for fallback processing: {chat_pdf_path}", current_chat_data
-                    uploaded_file_for_api_content = client.files.upload(file=chat_pdf_path)
+                    uploaded_file_for_api_content = get_uploaded_pdf(client, chat_pdf_path)
 
                 temp_history_for_fallback = [
                     types.Content(role="user", parts=[types.Part(text=system_instruction_str)]),
@@ -152,9 +285,12 @@ def generate_gemini_response(
 
 
             gen_config_args = {"temperature": 0.1}
-            final_fallback_for_this_api_call = should_use_fallback_definitively or use_fallback_for_this_run
+            final_fallback_for_this_api_call = use_fallback_for_this_run
 
-            if cache_name_for_generation and not final_fallback_for_this_api_call:
+            if use_retrieval:
+                gen_config_args["system_instruction"] = system_instruction_str
+                gen_config_args["tools"] = [gemini_tool_config]
+            elif cache_name_for_generation and not final_fallback_for_this_api_call:
                 gen_config_args["cached_content"] = cache_name_for_generation
             else:
                 gen_config_args["tools"] = [gemini_tool_config]
@@ -165,11 +301,17 @@ def generate_gemini_response(
                 answer_text = "Error: Internal problem, API conversation history is empty."
                 break
 
-            response = client.models.generate_content(
-                model=app_config.MODEL_TO_USE_FOR_API,
-                contents=api_conversation_history,
-                config=effective_gen_config
-            )
+            if on_text:
+                response = provider_loop.run_with_updates(
+                    lambda emit: generate_streaming_async(client, api_conversation_history, effective_gen_config, emit),
+                    on_text
+                )
+            else:
+                response = provider_loop.run(generate_async(client, api_conversation_history, effective_gen_config))
+
+            if response is None:
+                answer_text = "No response received from the model stream."
+                break
 
             if not response.candidates:
                 answer_text = "No response candidates from model."
@@ -182,41 +324,37 @@ def generate_gemini_response(
             if candidate.content and candidate.content.parts:
                 api_conversation_history.append(candidate.content)
 
-            function_call_to_execute = None
+            function_calls_to_execute = []
             if candidate.content and candidate.content.parts:
                 for part in candidate.content.parts:
                     if hasattr(part, 'function_call') and part.function_call and part.function_call.name:
-                        function_call_to_execute = part.function_call
-                        break
+                        function_calls_to_execute.append(part.function_call)
 
-            if function_call_to_execute:
-                fc_name = function_call_to_execute.name
-                fc_args_struct = function_call_to_execute.args
+            if function_calls_to_execute:
+                unavailable_tools = [fc.name for fc in function_calls_to_execute if fc.name not in tool_declaration.TOOL_IMPLEMENTATIONS]
+                if unavailable_tools:
+                    answer_text = f"Error: The model tried to use an unavailable tool: {', '.join(unavailable_tools)}."
+                    break
 
-                if fc_name in tool_declaration.TOOL_IMPLEMENTATIONS:
-                    tool_function = tool_declaration.TOOL_IMPLEMENTATIONS[fc_name]
-                    args_dict = {key: value for key, value in fc_args_struct.items()}
-                    try:
-                        tool_output_json_str = tool_function(**args_dict)
-                        tool_response_payload = {"content": tool_output_json_str}
-                    except Exception as e_tool_exec:
-                        tool_response_payload = {"content": json.dumps({"error": f"Failed to execute tool {fc_name}: {str(e_tool_exec)}"})}
-
-                    api_conversation_history.append(
-                        types.Content(
-                            parts=[types.Part(
+                tool_outputs = tool_executor.run_tool_calls(
+                    [(fc.name, {key: value for key, value in (fc.args or {}).items()}) for fc in function_calls_to_execute]
+                )
+                api_conversation_history.append(
+                    types.Content(
+                        parts=[
+                            types.Part(
                                 function_response=types.FunctionResponse(
-                                    name=fc_name,
-                                    response=tool_response_payload
+                                    id=fc.id,
+                                    name=fc.name,
+                                    response={"content": tool_output_json_str}
                                 )
-                            )],
-                            role="function"
-                        )
+                            )
+                            for fc, tool_output_json_str in zip(function_calls_to_execute, tool_outputs)
+                        ],
+                        role="function"
                     )
-                    num_function_calls += 1
-                else:
-                    answer_text = f"Error: The model tried to use an unavailable tool: {fc_name}."
-                    break
+                )
+                num_function_calls += 1
             else:
                 if candidate.content and candidate.content.parts:
                     answer_text = "".join(part.text for part in candidate.content.parts if hasattr(part, "text"))
@@ -234,17 +372,15 @@ def generate_gemini_response(
 
         if num_function_calls >= MAX_FUNCTION_CALLS:
             answer_text = "Exceeded maximum function call attempts. Please try rephrasing."
+        provider_clients.report_success(client)
 
     except FileNotFoundError as e_fnf:
         answer_text = str(e_fnf)
     except Exception as e_outer:
+        provider_clients.report_failure(client, e_outer)
+        if cache_key and cache_name_for_generation:
+            gemini_cache_pool.invalidate(cache_key, cache_name_for_generation)
         answer_text = f"An unexpected error occurred: {str(e_outer)}"
         st.exception(e_outer)
 
-    if uploaded_file_for_api_content:
-        try:
-            client.files.delete(name=uploaded_file_for_api_content.name)
-        except Exception:
-            pass
-
     return answer_text, current_chat_data
\ No newline at end of file
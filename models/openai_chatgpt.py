@@ -1,135 +1,296 @@
 # models/openai_chatgpt.py
 import streamlit as st
 import openai
+from openai import AsyncAssistantEventHandler
 import os
 import time
-import datetime
 import json
-from app_modules import tool_declaration
+import hashlib
+import threading
+from app_modules import app_config, tool_declaration, tool_executor, page_retrieval, upload_registry, openai_registry, pdf_extraction, provider_loop, provider_clients
 
 ASSISTANT_NAME = "PDF_Q&A_Financial_Assistant"
 
+_validated_assistant_ids = set()
+_assistant_lock = threading.Lock()
+
+def assistant_fingerprint(model_id, system_instruction, tools):
+    instructions_hash = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+    tools_hash = hashlib.sha256(json.dumps(tools, sort_keys=True).encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{model_id}|{instructions_hash}|{tools_hash}".encode("utf-8")).hexdigest()
+
+def _find_assistant_by_name(client, assistant_name):
+    # Only reached when the registry has no entry, e.g. to adopt an assistant created before the registry existed.
+    for assistant in client.beta.assistants.list(limit=100):
+        if assistant.name == assistant_name:
+            return assistant.id
+    return None
+
 def get_or_create_assistant(client, system_instruction, model_id):
+    """
+    Assistant ID for model_id from the local registry. The ID is checked against the API once per process,
+    and the assistant is updated in place when the instructions or tool schema change.
+    """
+    assistant_name = f"{ASSISTANT_NAME}_{model_id}"
+    all_tools = [{"type": "file_search"}] + tool_declaration.ALL_OPENAI_TOOLS
+    fingerprint = assistant_fingerprint(model_id, system_instruction, all_tools)
 
-    assistant_fingerprint = f"{ASSISTANT_NAME}_{model_id}"
     try:
-        assistants = client.beta.assistants.list(limit=100)
-        for assistant in assistants.data:
-            if assistant.name == assistant_fingerprint:
-                return assistant
+        record = openai_registry.get(openai_registry.ASSISTANTS, assistant_name)
+        if record and record["fingerprint"] == fingerprint and record["assistant_id"] in _validated_assistant_ids:
+            return record["assistant_id"]
 
-        all_tools = [{"type": "file_search"}] + tool_declaration.ALL_TOOL_DECLARATIONS
-        
-        assistant = client.beta.assistants.create(
-            name=assistant_fingerprint,
-            instructions=system_instruction,
-            model=model_id,
-            tools=all_tools,
-        )
-        return assistant
+        with _assistant_lock:
+            record = openai_registry.get(openai_registry.ASSISTANTS, assistant_name)
+            assistant_id = record["assistant_id"] if record else _find_assistant_by_name(client, assistant_name)
+
+            if assistant_id and assistant_id not in _validated_assistant_ids:
+                try:
+                    client.beta.assistants.retrieve(assistant_id)
+                except openai.NotFoundError:
+                    assistant_id = None
+
+            if assistant_id and (not record or record["fingerprint"] != fingerprint):
+                client.beta.assistants.update(
+                    assistant_id, instructions=system_instruction, model=model_id, tools=all_tools
+                )
+            elif not assistant_id:
+                assistant_id = client.beta.assistants.create(
+                    name=assistant_name,
+                    instructions=system_instruction,
+                    model=model_id,
+                    tools=all_tools,
+                ).id
+
+            _validated_assistant_ids.add(assistant_id)
+            if record != {"assistant_id": assistant_id, "fingerprint": fingerprint}:
+                openai_registry.put(
+                    openai_registry.ASSISTANTS, assistant_name, {"assistant_id": assistant_id, "fingerprint": fingerprint}
+                )
+            return assistant_id
     except Exception as e:
+        print(f"Warning: Could not initialize OpenAI assistant {assistant_name}: {e}")
+        return None
+
+def _upload_pdf(client, pdf_path):
+    with open(pdf_path, "rb") as file_data:
+        file_object = client.files.create(file=file_data, purpose="assistants")
+
+    try:
+        file_status = client.files.wait_for_processing(
+            file_object.id,
+            poll_interval=app_config.UPLOAD_POLL_INTERVAL_SECONDS,
+            max_wait_seconds=app_config.UPLOAD_PROCESSING_TIMEOUT_SECONDS,
+        )
+    except RuntimeError:
+        raise RuntimeError("File processing timed out.")
+    if file_status.status != 'processed':
+        raise RuntimeError("File processing failed on OpenAI's side.")
+    return file_object.id, time.time() + app_config.OPENAI_FILE_TTL_SECONDS
+
+def get_uploaded_file_id(client, pdf_path):
+    """OpenAI file ID for pdf_path, uploaded once per distinct file content for the whole process."""
+    def revalidate(current_file_id):
+        if client.files.retrieve(file_id=current_file_id).status == "processed":
+            return time.time() + app_config.OPENAI_FILE_TTL_SECONDS
+        return None
+
+    return upload_registry.get_or_upload(
+        upload_registry.PROVIDER_OPENAI, pdf_path, lambda path: _upload_pdf(client, path), revalidate
+    )
+
+def _vector_store_is_ready(client, vector_store_id):
+    try:
+        return client.vector_stores.retrieve(vector_store_id).status == "completed"
+    except openai.NotFoundError:
+        return False
+
+def _build_vector_store(client, pdf_path):
+    sha256 = pdf_extraction.file_sha256(pdf_path)
+    record = openai_registry.get(openai_registry.VECTOR_STORES, sha256)
+    if record and _vector_store_is_ready(client, record["vector_store_id"]):
+        return record["vector_store_id"], time.time() + app_config.OPENAI_VECTOR_STORE_REVALIDATE_SECONDS
+
+    file_id = get_uploaded_file_id(client, pdf_path)
+    vector_store = client.vector_stores.create(
+        name=f"{os.path.basename(pdf_path)}_{sha256[:12]}",
+        expires_after={"anchor": "last_active_at", "days": app_config.OPENAI_VECTOR_STORE_IDLE_DAYS},
+    )
+    vector_store_file = client.vector_stores.files.create_and_poll(
+        file_id,
+        vector_store_id=vector_store.id,
+        poll_interval_ms=int(app_config.UPLOAD_POLL_INTERVAL_SECONDS * 1000),
+        max_wait_seconds=app_config.UPLOAD_PROCESSING_TIMEOUT_SECONDS,
+    )
+    if vector_store_file.status != "completed":
+        raise RuntimeError("Document indexing failed on OpenAI's side.")
+
+    openai_registry.put(openai_registry.VECTOR_STORES, sha256, {
+        "vector_store_id": vector_store.id, "file_id": file_id, "status": vector_store_file.status,
+        "pdf_name": os.path.basename(pdf_path), "indexed_at": time.time(),
+    })
+    return vector_store.id, time.time() + app_config.OPENAI_VECTOR_STORE_REVALIDATE_SECONDS
+
+def get_vector_store_id(client, pdf_path):
+    """Vector store indexing pdf_path, built once per distinct file content and shared by every thread on it."""
+    def revalidate(vector_store_id):
+        if _vector_store_is_ready(client, vector_store_id):
+            return time.time() + app_config.OPENAI_VECTOR_STORE_REVALIDATE_SECONDS
         return None
 
-def get_openai_response(api_key, model_id, system_instruction, pdf_path, user_query, thread_id=None, file_id=None):
-    response_payload = {"response_text": "Error: Failed to get response from OpenAI.", "thread_id": thread_id, "file_id": file_id}
-    
+    return upload_registry.get_or_upload(
+        upload_registry.PROVIDER_OPENAI_VECTOR_STORE, pdf_path, lambda path: _build_vector_store(client, path), revalidate
+    )
+
+class RunEventHandler(AsyncAssistantEventHandler):
+    """Streams a run's text to emit and submits tool outputs the moment the run requires action."""
+
+    def __init__(self, async_client, thread_id, emit=None, script_run_ctx=None):
+        super().__init__()
+        self.async_client = async_client
+        self.thread_id = thread_id
+        self.emit = emit
+        self.script_run_ctx = script_run_ctx
+        self.final_run = None
+        self.final_text = None
+
+    async def on_event(self, event):
+        if event.event == "thread.run.requires_action":
+            await self._submit_tool_outputs(event.data)
+        elif event.event in ("thread.run.completed", "thread.run.failed", "thread.run.cancelled",
+                             "thread.run.expired", "thread.run.incomplete"):
+            self.final_run = event.data
+
+    async def on_text_delta(self, delta, snapshot):
+        if self.emit:
+            self.emit(snapshot.value)
+
+    async def on_message_done(self, message):
+        text = "".join(block.text.value for block in message.content if block.type == "text")
+        if text:
+            self.final_text = text
+
+    async def _submit_tool_outputs(self, run):
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        outputs = await tool_executor.run_tool_calls_async(
+            [(tool_call.function.name, json.loads(tool_call.function.arguments)) for tool_call in tool_calls],
+            script_run_ctx=self.script_run_ctx
+        )
+        tool_outputs = [
+            {"tool_call_id": tool_call.id, "output": json.dumps(output)}
+            for tool_call, output in zip(tool_calls, outputs)
+        ]
+
+        continuation = RunEventHandler(self.async_client, self.thread_id, self.emit, self.script_run_ctx)
+        async with self.async_client.beta.threads.runs.submit_tool_outputs_stream(
+            thread_id=self.thread_id, run_id=run.id, tool_outputs=tool_outputs, event_handler=continuation
+        ) as stream:
+            await stream.until_done()
+        self.final_run = continuation.final_run or self.final_run
+        self.final_text = continuation.final_text or self.final_text
+
+async def run_assistant_async(api_key, thread_id, assistant_id, message_content, emit=None, script_run_ctx=None,
+                              additional_instructions=None):
+    """
+    Post message_content to the thread and stream one assistant run. additional_instructions apply to this run only
+    and are never stored in the thread. Returns (final run, final answer text).
+    """
+    async_client = provider_clients.get_async_openai_client(api_key)
+    await async_client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message_content)
+
+    event_handler = RunEventHandler(async_client, thread_id, emit, script_run_ctx)
+    async with async_client.beta.threads.runs.stream(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        additional_instructions=additional_instructions,
+        event_handler=event_handler,
+    ) as stream:
+        await stream.until_done()
+
+    run = event_handler.final_run
+    if run is not None and run.status == "completed" and event_handler.final_text is None:
+        messages = await async_client.beta.threads.messages.list(thread_id=thread_id, limit=1)
+        event_handler.final_text = messages.data[0].content[0].text.value
+    return run, event_handler.final_text
+
+def record_turn(api_key, thread_id, user_query, answer_text):
+    """
+    Post a question answered outside the assistant, and its answer, to the thread so later runs see the turn.
+    Creates the thread if the chat has none yet; returns the thread ID (unchanged if posting failed).
+    """
+    client = provider_clients.get_openai_client(api_key)
     try:
-        client = openai.OpenAI(api_key=api_key)
-        assistant = get_or_create_assistant(client, system_instruction, model_id)
-        if not assistant:
+        if not thread_id:
+            thread_id = client.beta.threads.create().id
+        client.beta.threads.messages.create(thread_id=thread_id, role="user", content=user_query)
+        client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=answer_text)
+        provider_clients.report_success(client)
+    except Exception as e:
+        provider_clients.report_failure(client, e)
+        print(f"Warning: Could not add the answered question to OpenAI thread {thread_id}: {e}")
+    return thread_id
+
+def get_openai_response(api_key, model_id, system_instruction, pdf_path, user_query, thread_id=None,
+                        document_mode=app_config.DOCUMENT_MODE_FULL, on_text=None, vector_store_id=None):
+    response_payload = {
+        "response_text": "Error: Failed to get response from OpenAI.",
+        "thread_id": thread_id, "vector_store_id": vector_store_id,
+    }
+    use_retrieval = document_mode == app_config.DOCUMENT_MODE_RETRIEVAL
+
+    client = provider_clients.get_openai_client(api_key)
+    try:
+        assistant_id = get_or_create_assistant(client, system_instruction, model_id)
+        if not assistant_id:
             response_payload["response_text"] = "Failed to initialize OpenAI Assistant."
             return response_payload
 
-        file_upload_time_key = f"openai_{pdf_path}_upload_time"
-        current_file_id = file_id
-        upload_time = st.session_state.get(file_upload_time_key)
-
-        if current_file_id and upload_time:
-            elapsed = (datetime.datetime.now() - upload_time).total_seconds()
-            if elapsed > 3600:
-                current_file_id = None
-                st.session_state.pop(file_upload_time_key, None)
-
-        if not current_file_id:
-            with open(pdf_path, "rb") as file_data:
-                file_object = client.files.create(file=file_data, purpose="assistants")
-            current_file_id = file_object.id
-
-            with st.spinner("Preparing document for Q&A... This may take a moment."):
-                start_time = time.time()
-                while True:
-                    if time.time() - start_time > 60: 
-                        st.error("File processing timed out.")
-                        return response_payload
-
-                    file_status = client.files.retrieve(file_id=current_file_id)
-                    if file_status.status == 'processed':
-                        break
-                    elif file_status.status == 'failed':
-                        st.error("File processing failed on OpenAI's side.")
-                        return response_payload
-                    
-                    time.sleep(2)
-            
-            st.session_state[file_upload_time_key] = datetime.datetime.now()
-        
-        response_payload["file_id"] = current_file_id
+        current_vector_store_id = None
+        if not use_retrieval:
+            try:
+                with st.spinner("Preparing document for Q&A... This may take a moment."):
+                    current_vector_store_id = get_vector_store_id(client, pdf_path)
+            except RuntimeError as e:
+                st.error(str(e))
+                return response_payload
+
+        file_search_resources = {"file_search": {"vector_store_ids": [current_vector_store_id]}} if current_vector_store_id else None
 
         if not thread_id:
-            thread = client.beta.threads.create()
+            thread = client.beta.threads.create(tool_resources=file_search_resources) if file_search_resources else client.beta.threads.create()
             thread_id = thread.id
-        
+        elif file_search_resources and vector_store_id != current_vector_store_id:
+            client.beta.threads.update(thread_id, tool_resources=file_search_resources)
+
         response_payload["thread_id"] = thread_id
+        response_payload["vector_store_id"] = current_vector_store_id or vector_store_id
 
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=user_query,
-            attachments=[{"file_id": current_file_id, "tools": [{"type": "file_search"}]}]
-        )
+        # Excerpts go with this run only, so the thread does not accumulate every turn's page context.
+        page_context = page_retrieval.build_page_context(pdf_path, user_query) if use_retrieval else None
 
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant.id,
+        script_run_ctx = tool_executor.current_script_context()
+        run, final_text = provider_loop.run_with_updates(
+            lambda emit: run_assistant_async(
+                api_key, thread_id, assistant_id, user_query, emit, script_run_ctx, additional_instructions=page_context
+            ),
+            on_text or (lambda text: None)
         )
 
-        while run.status in ["queued", "in_progress", "requires_action"]:
-            if run.status == "requires_action":
-                tool_outputs = []
-                
-                for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
-                    
-                    if tool_name in tool_declaration.TOOL_IMPLEMENTATIONS:
-                        implementation = tool_declaration.TOOL_IMPLEMENTATIONS[tool_name]
-                        output = implementation(**tool_args)
-                        
-                        tool_outputs.append({
-                            "tool_call_id": tool_call.id,
-                            "output": json.dumps(output),
-                        })
-                
-                run = client.beta.threads.runs.submit_tool_outputs(
-                    thread_id=thread_id,
-                    run_id=run.id,
-                    tool_outputs=tool_outputs
-                )
-            
-            time.sleep(1)
-            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-
-        if run.status == "completed":
-            messages = client.beta.threads.messages.list(thread_id=thread_id, limit=1)
-            response_payload["response_text"] = messages.data[0].content[0].text.value
+        if run is None:
+            response_payload["response_text"] = "Assistant run ended without a final status."
+        elif run.status == "completed":
+            response_payload["response_text"] = final_text
         else:
             error_message = f"Assistant run finished with status: {run.status}"
             if run.last_error:
                 error_message += f" - {run.last_error.message}"
             response_payload["response_text"] = error_message
         
+        provider_clients.report_success(client)
         return response_payload
 
     except Exception as e:
+        provider_clients.report_failure(client, e)
+        provider_clients.report_failure(provider_clients.get_async_openai_client(api_key), e)
         response_payload["response_text"] = f"An unexpected error occurred: {str(e)}"
         return response_payload
\ No newline at end of file